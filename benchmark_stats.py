@@ -0,0 +1,47 @@
+"""
+Benchmark: per-video stats counts vs one batch aggregation
+
+Usage: python benchmark_stats.py [number_of_videos] [rounds]
+"""
+import sys
+import time
+import asyncio
+from mongodb_config import downloads_collection, MongoDownload
+
+async def per_video_stats(video_ids):
+    """The old path: two count_documents calls per video"""
+    stats = {}
+    for video_id in video_ids:
+        stats[video_id] = {
+            "total_streams": await downloads_collection.count_documents({"video_id": video_id, "download_type": "stream"}),
+            "total_downloads": await downloads_collection.count_documents({"video_id": video_id, "download_type": "download"})
+        }
+    return stats
+
+async def timed(label, func, video_ids, rounds):
+    """Run func a few times and print the best wall time"""
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = await func(video_ids)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<12} {best * 1000:10.1f} ms  ({len(video_ids)} videos, best of {rounds})")
+    return result
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    video_ids = list(await MongoDownload.batch_stats(top_k=count))
+    if not video_ids:
+        print("No download records to benchmark against")
+        return
+
+    per_video = await timed("per-video", per_video_stats, video_ids, rounds)
+    batch = await timed("batch", MongoDownload.batch_stats, video_ids, rounds)
+    print("Results match" if per_video == batch else "Results differ")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+"""
+In-process caching helpers for TeraBox Bot
+"""
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Bounded LRU cache with per-entry TTL and single-flight loading"""
+
+    def __init__(self, maxsize=1024, ttl=600, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}         # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return a fresh cached value or None"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single key"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every cached entry"""
+        self._data.clear()
+
+    async def get_or_load(self, key, loader, ttl=None, cacheable=None):
+        """Return the cached value or run loader once for all concurrent callers
+
+        ``ttl`` may be a number or a callable taking the loaded value.
+        ``cacheable`` decides whether a loaded value is stored; None results
+        are never cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t, ttl, cacheable))
+
+        # Shield so a cancelled caller does not abort the load for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task, ttl, cacheable):
+        """Store the result of a finished load"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        value = task.result()
+        if value is None or (cacheable is not None and not cacheable(value)):
+            return
+
+        if callable(ttl):
+            try:
+                ttl = ttl(value)
+            except Exception as e:
+                logger.error(f"Error computing TTL for {self.name} cache: {e}")
+                ttl = None
+        self.set(key, value, ttl)
+
+    def stats(self):
+        """Get cache counters"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+        }
+
+class NegativeCache:
+    """Remembers failed loads and suppresses retries with exponential backoff"""
+
+    def __init__(self, base_ttl=30, max_ttl=1800, maxsize=4096, name="negative"):
+        self.base_ttl = base_ttl
+        self.max_ttl = max_ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()  # key -> (failures, expires_at, context)
+        self.failures_recorded = 0
+        self.suppressed = 0
+
+    def is_suppressed(self, key):
+        """Check if a key failed recently; counts the suppressed attempt"""
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return False
+
+        self.suppressed += 1
+        return True
+
+    def record_failure(self, key, context=None):
+        """Record a failure, doubling the suppression window each time"""
+        now = time.monotonic()
+        failures, expires_at, _ = self._data.get(key, (0, now, None))
+        if now - expires_at > self.max_ttl:
+            # Quiet for a long time; start the backoff over
+            failures = 0
+
+        failures += 1
+        ttl = min(self.base_ttl * 2 ** (failures - 1), self.max_ttl)
+        self._data[key] = (failures, now + ttl, context)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+        self.failures_recorded += 1
+        return ttl
+
+    def get_context(self, key):
+        """Get the context stored with the last failure"""
+        entry = self._data.get(key)
+        return entry[2] if entry else None
+
+    def clear(self, key):
+        """Forget a key after a success or a forced refresh"""
+        self._data.pop(key, None)
+
+    def stats(self):
+        """Get cache counters"""
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "active": sum(1 for _, expires_at, _ in self._data.values() if expires_at > now),
+            "failures_recorded": self.failures_recorded,
+            "suppressed": self.suppressed
+        }
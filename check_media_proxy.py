@@ -0,0 +1,141 @@
+"""
+Check /media range handling against a local upstream
+
+Starts an aiohttp server on localhost that serves a random file, points a
+fake video at it and checks the status, headers and bytes of the proxied
+responses, both straight through and from the segment cache.
+
+Usage: python check_media_proxy.py
+"""
+import os
+import sys
+import random
+import asyncio
+import tempfile
+
+# Small segments and a throwaway cache directory, set before the imports read them
+os.environ.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="media-check-"))
+os.environ.setdefault("MEDIA_SEGMENT_SIZE", "1024")
+os.environ.setdefault("MEDIA_CHUNK_SIZE", "256")
+os.environ["MEDIA_CACHE_ENABLED"] = "true"
+
+from aiohttp import web
+from features import media
+from http_client import media_pool
+
+SIZE = 5120
+DATA = random.Random(0).randbytes(SIZE)
+ETAG = '"check"'
+
+failures = []
+
+def ranged_upstream(request):
+    """Upstream that serves single byte ranges"""
+    byte_range = media.parse_range(request.headers.get("Range"), SIZE) if "Range" in request.headers else None
+    if byte_range:
+        start, end = byte_range
+        return web.Response(status=206, body=DATA[start:end + 1], headers={
+            "Content-Range": f"bytes {start}-{end}/{SIZE}", "Accept-Ranges": "bytes", "ETag": ETAG
+        })
+    return web.Response(body=DATA, headers={"Accept-Ranges": "bytes", "ETag": ETAG})
+
+async def upstream_handler(request):
+    try:
+        return ranged_upstream(request)
+    except media.RangeNotSatisfiable:
+        return web.Response(status=416, text="unsatisfiable", headers={"Content-Range": f"bytes */{SIZE}"})
+
+async def flaky_handler(request):
+    """Upstream that fails ranges past the first segment"""
+    if request.headers.get("Range", "bytes=0").startswith("bytes=0"):
+        return await upstream_handler(request)
+    return web.Response(status=500, text="boom")
+
+async def plain_handler(request):
+    """Upstream that ignores ranges"""
+    return web.Response(body=DATA)
+
+async def fetch(video_id, range_header=None, if_range=None):
+    """Proxy one request and collect (status, headers, body)"""
+    status, headers, body = await media.open_media(video_id, range_header, if_range)
+    return status, headers, b"".join([chunk async for chunk in body])
+
+def check(label, result, status, data=None, content_range=None):
+    """Compare one response with what is expected"""
+    got_status, headers, body = result
+    problems = []
+    if got_status != status:
+        problems.append(f"status {got_status} != {status}")
+    if data is not None and body != data:
+        problems.append(f"body of {len(body)} bytes differs")
+    if content_range is not None and headers.get("Content-Range") != content_range:
+        problems.append(f"Content-Range {headers.get('Content-Range')!r} != {content_range!r}")
+    if "Content-Length" in headers and int(headers["Content-Length"]) != len(body):
+        problems.append(f"Content-Length {headers['Content-Length']} != body {len(body)}")
+
+    print(f"{'FAIL' if problems else 'ok':<5}{label}" + (f": {'; '.join(problems)}" if problems else ""))
+    if problems:
+        failures.append(label)
+
+async def run_checks(base_url):
+    videos = {"ranged": f"{base_url}/ranged", "plain": f"{base_url}/plain", "flaky": f"{base_url}/flaky"}
+
+    async def find_by_id(video_id):
+        return {"_id": video_id, "video_url": videos[video_id]}
+    media.MongoVideo.find_by_id = staticmethod(find_by_id)
+
+    # Straight through: nothing is known about the file yet
+    check("full file", await fetch("ranged"), 200, DATA)
+    media.media_meta.invalidate("ranged")
+    check("range", await fetch("ranged", "bytes=100-250"), 206, DATA[100:251], f"bytes 100-250/{SIZE}")
+    media.media_meta.invalidate("ranged")
+    check("past end", await fetch("ranged", "bytes=9000-"), 416, b"", f"bytes */{SIZE}")
+
+    # From the segment cache, filling gaps from upstream
+    await fetch("ranged", "bytes=0-0")
+    check("cached range", await fetch("ranged", "bytes=1000-3000"), 206, DATA[1000:3001], f"bytes 1000-3000/{SIZE}")
+    check("cached again", await fetch("ranged", "bytes=1500-2500"), 206, DATA[1500:2501], f"bytes 1500-2500/{SIZE}")
+    check("cached suffix", await fetch("ranged", "bytes=-500"), 206, DATA[-500:], f"bytes {SIZE - 500}-{SIZE - 1}/{SIZE}")
+    check("cached open end", await fetch("ranged", "bytes=4000-"), 206, DATA[4000:], f"bytes 4000-{SIZE - 1}/{SIZE}")
+    check("cached past end", await fetch("ranged", "bytes=9000-"), 416, b"", f"bytes */{SIZE}")
+    check("cached empty suffix", await fetch("ranged", "bytes=-0"), 416, b"", f"bytes */{SIZE}")
+    check("cached malformed", await fetch("ranged", "bytes=abc"), 200, DATA)
+    check("cached If-Range stale", await fetch("ranged", "bytes=10-20", '"old"'), 200, DATA)
+    check("cached If-Range fresh", await fetch("ranged", "bytes=10-20", ETAG), 206, DATA[10:21])
+
+    # A failing fill is reported before any headers are sent
+    await fetch("flaky", "bytes=0-0")
+    try:
+        result = await fetch("flaky", "bytes=3000-3100")
+    except media.UpstreamError:
+        result = (502, {}, b"")  # what /media answers for UpstreamError
+    check("cached upstream error", result, 502, b"")
+
+    # Upstream without range support: the proxy cuts the range itself
+    check("sliced range", await fetch("plain", "bytes=100-250"), 206, DATA[100:251], f"bytes 100-250/{SIZE}")
+    check("sliced past end", await fetch("plain", "bytes=9000-"), 416, b"", f"bytes */{SIZE}")
+
+async def main():
+    app = web.Application()
+    app.router.add_get("/ranged", upstream_handler)
+    app.router.add_get("/plain", plain_handler)
+    app.router.add_get("/flaky", flaky_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    try:
+        await run_checks(f"http://127.0.0.1:{port}")
+    finally:
+        await media_pool.close()
+        await runner.cleanup()
+
+    print(f"\n{len(failures)} failed" if failures else "\nAll checks passed")
+    print(f"media_proxy: {media.media_stats}")
+    print(f"media_segments: {media.segment_cache.stats()}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,87 @@
+"""
+History command handler for TeraBox Bot
+"""
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pyrogram import filters
+from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from mongodb_config import MongoSubmission
+from config_vars import HISTORY_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+EMPTY_HISTORY = "📝 No recent links found. Send me a TeraBox link to get started!"
+
+def encode_cursor(prefix, submission):
+    """Callback data for a page boundary: <prefix>_<created_at ms>_<id>"""
+    millis = (submission["created_at"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{prefix}_{millis}_{submission['_id']}"
+
+def decode_cursor(data):
+    """(created_at, _id) key from callback data, or None if malformed"""
+    try:
+        _, millis, object_id = data.split("_")
+        return EPOCH + timedelta(milliseconds=int(millis)), ObjectId(object_id)
+    except Exception:
+        return None
+
+class HistoryCommand:
+    def __init__(self, bot):
+        self.bot = bot
+        self.bot.on_message(filters.command("history"))(self.handle_history)
+    
+    async def handle_history(self, client, message: Message):
+        """Handle /history command"""
+        text, reply_markup = await self.render_page(message.from_user.id)
+        await message.reply_text(text, reply_markup=reply_markup)
+    
+    @staticmethod
+    async def handle_callback(callback_query, data):
+        """Handle the History button and Next/Prev page buttons"""
+        before = after = None
+        if data.startswith("hn_"):
+            before = decode_cursor(data)
+        elif data.startswith("hp_"):
+            after = decode_cursor(data)
+        
+        text, reply_markup = await HistoryCommand.render_page(callback_query.from_user.id, before=before, after=after)
+        await callback_query.edit_message_text(text, reply_markup=reply_markup)
+    
+    @staticmethod
+    async def render_page(user_id, before=None, after=None):
+        """Build the text and buttons for one history page"""
+        try:
+            submissions, has_more = await MongoSubmission.find_page(
+                user_id, limit=HISTORY_PAGE_SIZE, before=before, after=after
+            )
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            return EMPTY_HISTORY, None
+        
+        if not submissions:
+            return EMPTY_HISTORY, None
+        
+        history_message = "📚 **Your Recent Links:**\n\n"
+        for submission in submissions:
+            status_emoji = "✅" if submission.get("status") == "completed" else "⏳" if submission.get("status") == "processing" else "❌"
+            title = submission.get("title", "Unknown Title")
+            created_at = submission.get("created_at")
+            date_str = created_at.strftime('%Y-%m-%d %H:%M') if created_at else "Unknown"
+            history_message += f"{status_emoji} {title}\n"
+            history_message += f"   📅 {date_str}\n\n"
+        
+        # Paging backwards fetched extra newer entries; forwards, extra older ones
+        has_newer = has_more if after is not None else before is not None
+        has_older = has_more if after is None else True
+        
+        buttons = []
+        if has_newer:
+            buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=encode_cursor("hp", submissions[0])))
+        if has_older:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=encode_cursor("hn", submissions[-1])))
+        
+        keyboard = [buttons] if buttons else []
+        keyboard.append([InlineKeyboardButton("🔙 Back to Main", callback_data="start")])
+        return history_message, InlineKeyboardMarkup(keyboard)
@@ -4,11 +4,14 @@ Stream/Download command handler for TeraBox Bot
 import logging
 from pyrogram import filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from terabox_scraper import TeraBoxScraper
-from utils import validate_terabox_url, format_file_size
-from mongodb_config import MongoVideo
+from terabox_scraper import TeraBoxScraper, failure_cache
+from utils import validate_terabox_url, format_file_size, extract_terabox_id
+from mongodb_config import MongoVideo, MongoSubmission
 from features.info import format_duration
-from config_vars import LOG_GROUP_ID, SUPPORT_GROUP, SUPPORT_CHANNEL, START_MESSAGE, HELP_MESSAGE
+from commands.history import HistoryCommand
+from features.upload import schedule_send
+from features.thumbnail import schedule_prefetch
+from config_vars import LOG_GROUP_ID, SUPPORT_GROUP, SUPPORT_CHANNEL, START_MESSAGE, HELP_MESSAGE, TELEGRAM_UPLOAD_LIMIT
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +27,6 @@ class StreamCommand:
     async def handle_message(self, client, message: Message):
         """Handle incoming messages with TeraBox links"""
         message_text = message.text
-        user_id = message.from_user.id
         
         # Check if message contains TeraBox link
         if not validate_terabox_url(message_text):
@@ -40,35 +42,52 @@ class StreamCommand:
         # Show processing message
         processing_msg = await message.reply_text("🔄 Processing your TeraBox link...\n\nPlease wait while I extract video information.")
         
+        await self.process_link(processing_msg, message.from_user, terabox_url)
+    
+    async def process_link(self, processing_msg, user, terabox_url, force_refresh=False):
+        """Resolve a TeraBox link and edit the processing message with the result"""
+        user_id = user.id
+        
         try:
             # Extract video information
-            video_info = await self.scraper.extract_video_info(terabox_url)
+            video_info = await self.scraper.extract_video_info(terabox_url, force_refresh=force_refresh)
             
             if not video_info:
-                await processing_msg.edit_text("❌ Failed to extract video information. Please check the link and try again.")
+                share_id = extract_terabox_id(terabox_url)
+                reply_markup = None
+                if share_id and len(f"retry_{share_id}") <= 64:  # Telegram callback data limit
+                    reply_markup = InlineKeyboardMarkup([
+                        [InlineKeyboardButton("🔄 Try Again", callback_data=f"retry_{share_id}")]
+                    ])
+                await processing_msg.edit_text(
+                    "❌ Failed to extract video information. Please check the link and try again.",
+                    reply_markup=reply_markup
+                )
                 return
             
-            # Save to MongoDB
+            # Save to MongoDB: one canonical video per share, one submission per user
             try:
-                video_data = {
+                share_id = extract_terabox_id(terabox_url) or terabox_url
+                video_id, created = await MongoVideo.upsert_by_share(share_id, terabox_url, video_info)
+                await MongoSubmission.create({
                     "user_id": user_id,
+                    "video_id": video_id,
+                    "share_id": share_id,
                     "original_url": terabox_url,
                     "title": video_info.get('title', 'Unknown Title'),
-                    "file_size": video_info.get('file_size', 0),
-                    "duration": video_info.get('duration', 0),
-                    "thumbnail_url": video_info.get('thumbnail_url'),
-                    "video_url": video_info.get('video_url'),
-                    "download_urls": video_info.get('download_urls', []),
                     "status": 'completed'
-                }
-                video_id = await MongoVideo.create(video_data)
+                })
+                
+                # Warm the thumbnail cache while the user reads the reply
+                if video_info.get('thumbnail_url'):
+                    schedule_prefetch(video_id)
                 
                 # Log to log group
                 try:
                     await self.bot.send_message(
                         LOG_GROUP_ID,
-                        f"📹 **New Video Processed**\n\n"
-                        f"👤 User: {message.from_user.first_name} (`{user_id}`)\n"
+                        f"📹 **{'New Video' if created else 'Video'} Processed**\n\n"
+                        f"👤 User: {user.first_name} (`{user_id}`)\n"
                         f"🎬 Title: {video_info.get('title', 'Unknown')}\n"
                         f"📏 Size: {format_file_size(video_info.get('file_size', 0))}\n"
                         f"🔗 URL: `{terabox_url[:50]}...`"
@@ -90,6 +109,7 @@ class StreamCommand:
             keyboard = [
                 [InlineKeyboardButton("🎥 Stream Online", callback_data=f"stream_{video_id}")],
                 [InlineKeyboardButton("📥 Download", callback_data=f"download_{video_id}")],
+                [InlineKeyboardButton("📤 Send to Chat", callback_data=f"send_{video_id}")],
                 [InlineKeyboardButton("ℹ️ More Info", callback_data=f"info_{video_id}")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -120,8 +140,8 @@ class StreamCommand:
             reply_markup = InlineKeyboardMarkup(keyboard)
             await callback_query.edit_message_text(help_text, reply_markup=reply_markup)
             
-        elif data == "history":
-            await self.handle_history(callback_query)
+        elif data == "history" or data.startswith(("hn_", "hp_")):
+            await HistoryCommand.handle_callback(callback_query, data)
             
         elif data == "start":
             welcome_text = START_MESSAGE.format(
@@ -143,41 +163,55 @@ class StreamCommand:
         elif data.startswith("download_"):
             video_id = data.split("_")[1]
             await self.handle_download_request(callback_query, video_id, user_id)
+        elif data.startswith("send_"):
+            video_id = data.split("_")[1]
+            await self.handle_send_request(callback_query, video_id, user_id)
         elif data.startswith("info_"):
             video_id = data.split("_")[1]
             await self.handle_info_request(callback_query, video_id, user_id)
+        elif data.startswith("retry_"):
+            share_id = data[len("retry_"):]
+            await self.handle_retry_request(callback_query, share_id)
     
-    async def handle_history(self, callback_query):
-        """Handle history request"""
-        user_id = callback_query.from_user.id
+    async def handle_retry_request(self, callback_query, share_id):
+        """Handle a forced retry of a link that failed to resolve"""
+        terabox_url = failure_cache.get_context(share_id)
+        if not terabox_url:
+            await callback_query.edit_message_text("❌ This link has expired. Please send it again.")
+            return
         
+        await callback_query.edit_message_text("🔄 Retrying your TeraBox link...\n\nPlease wait while I extract video information.")
+        await self.process_link(callback_query.message, callback_query.from_user, terabox_url, force_refresh=True)
+    
+    async def handle_send_request(self, callback_query, video_id, user_id):
+        """Handle a request to send the video itself into the chat"""
         try:
-            recent_videos = await MongoVideo.find_by_user(user_id, limit=10)
+            video = await MongoVideo.find_by_id(video_id)
+            
+            if not video or not await MongoSubmission.has_access(user_id, video_id):
+                await callback_query.edit_message_text("❌ Video not found or access denied.")
+                return
             
-            if not recent_videos:
-                await callback_query.edit_message_text("📝 No recent links found. Send me a TeraBox link to get started!")
+            if video.get("file_size", 0) > TELEGRAM_UPLOAD_LIMIT:
+                await callback_query.edit_message_text("❌ This video is too large to send on Telegram. Please use the download links instead.")
                 return
             
-            history_message = "📚 **Your Recent Links:**\n\n"
-            for i, video in enumerate(recent_videos, 1):
-                status_emoji = "✅" if video.get("status") == "completed" else "⏳" if video.get("status") == "processing" else "❌"
-                title = video.get("title", "Unknown Title")
-                created_at = video.get("created_at")
-                date_str = created_at.strftime('%Y-%m-%d %H:%M') if created_at else "Unknown"
-                history_message += f"{i}. {status_emoji} {title}\n"
-                history_message += f"   📅 {date_str}\n\n"
+            if video.get("telegram_file_id"):
+                await callback_query.edit_message_text("📤 Sending your video...")
+            else:
+                await callback_query.edit_message_text("📥 Preparing your video...\n\nLarge files can take a few minutes.")
             
-            await callback_query.edit_message_text(history_message)
+            schedule_send(self.bot, video_id, callback_query.message.chat.id, callback_query.message)
         except Exception as e:
-            logger.error(f"Database error: {e}")
-            await callback_query.edit_message_text("📝 No recent links found. Send me a TeraBox link to get started!")
+            logger.error(f"Error sending video {video_id}: {e}")
+            await callback_query.message.edit_text("❌ Error sending video. Please try again later.")
     
     async def handle_stream_request(self, callback_query, video_id, user_id):
         """Handle stream request"""
         try:
             video = await MongoVideo.find_by_id(video_id)
             
-            if not video or video.get("user_id") != user_id:
+            if not video or not await MongoSubmission.has_access(user_id, video_id):
                 await callback_query.edit_message_text("❌ Video not found or access denied.")
                 return
         
@@ -210,7 +244,7 @@ class StreamCommand:
         try:
             video = await MongoVideo.find_by_id(video_id)
             
-            if not video or video.get("user_id") != user_id:
+            if not video or not await MongoSubmission.has_access(user_id, video_id):
                 await callback_query.edit_message_text("❌ Video not found or access denied.")
                 return
         
@@ -234,6 +268,7 @@ class StreamCommand:
                 keyboard.append([InlineKeyboardButton(f"📥 Download Link {i}", url=url)])
             
             keyboard.extend([
+                [InlineKeyboardButton("📤 Send to Chat", callback_data=f"send_{video_id}")],
                 [InlineKeyboardButton("🎥 Stream Instead", callback_data=f"stream_{video_id}")],
                 [InlineKeyboardButton("🔙 Back", callback_data=f"info_{video_id}")]
             ])
@@ -250,7 +285,7 @@ class StreamCommand:
         try:
             video = await MongoVideo.find_by_id(video_id)
             
-            if not video or video.get("user_id") != user_id:
+            if not video or not await MongoSubmission.has_access(user_id, video_id):
                 await callback_query.edit_message_text("❌ Video not found or access denied.")
                 return
         
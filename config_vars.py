@@ -1,6 +1,7 @@
 """
 Configuration variables for TeraBox Bot
 """
+import os
 
 # Bot configuration
 LOG_GROUP_ID = -1002469952747
@@ -66,4 +67,147 @@ HELP_MESSAGE = """📖 **Help & Commands**
 • Group: {support_group}
 • Channel: {support_channel}
 
-Happy downloading! 🎉"""
\ No newline at end of file
+Happy downloading! 🎉"""
+
+# Resolution cache
+RESOLUTION_CACHE_TTL = int(os.getenv("RESOLUTION_CACHE_TTL", "600"))
+RESOLUTION_CACHE_SIZE = int(os.getenv("RESOLUTION_CACHE_SIZE", "2048"))
+
+# HTML parse stage: worker processes (0 parses in a thread) and parser backend
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+HTML_PARSER = os.getenv("HTML_PARSER", "auto")
+
+# Download URL probing: "first" returns on the first valid URL, "all" collects
+# every valid URL until the deadline (seconds)
+PROBE_MODE = os.getenv("PROBE_MODE", "first")
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "5"))
+PROBE_DEADLINE = float(os.getenv("PROBE_DEADLINE", "8"))
+
+# Hedged API requests: seconds to wait on the primary endpoint before starting
+# the next one (0 starts all at once); adaptive mode waits for the primary's
+# recent p95 latency
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "1"))
+HEDGE_DELAY_MAX = float(os.getenv("HEDGE_DELAY_MAX", "3"))
+HEDGE_ADAPTIVE = os.getenv("HEDGE_ADAPTIVE", "true").lower() == "true"
+
+# Streaming share page fetch: stop reading once the link fields have arrived,
+# scanning at most STREAM_FETCH_MAX_BYTES before reading the whole page
+STREAM_FETCH_ENABLED = os.getenv("STREAM_FETCH_ENABLED", "true").lower() == "true"
+STREAM_FETCH_CHUNK_SIZE = int(os.getenv("STREAM_FETCH_CHUNK_SIZE", "16384"))
+STREAM_FETCH_MAX_BYTES = int(os.getenv("STREAM_FETCH_MAX_BYTES", "524288"))
+
+# Shared HTTP client pool (connections, seconds; 0 disables DNS caching or
+# happy eyeballs)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_HAPPY_EYEBALLS_DELAY = float(os.getenv("HTTP_HAPPY_EYEBALLS_DELAY", "0"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+# Per-host adaptive concurrency (AIMD) and circuit breaker for TeraBox domains
+HOST_INITIAL_LIMIT = int(os.getenv("HOST_INITIAL_LIMIT", "8"))
+HOST_MIN_LIMIT = int(os.getenv("HOST_MIN_LIMIT", "1"))
+HOST_MAX_LIMIT = int(os.getenv("HOST_MAX_LIMIT", "32"))
+HOST_LATENCY_TARGET = float(os.getenv("HOST_LATENCY_TARGET", "5"))
+HOST_DECREASE_FACTOR = float(os.getenv("HOST_DECREASE_FACTOR", "0.5"))
+HOST_BREAKER_THRESHOLD = int(os.getenv("HOST_BREAKER_THRESHOLD", "5"))
+HOST_BREAKER_COOLDOWN = float(os.getenv("HOST_BREAKER_COOLDOWN", "30"))
+
+# End-to-end budget for resolving one link (seconds); stages share what is left
+RESOLVE_BUDGET = float(os.getenv("RESOLVE_BUDGET", "8"))
+RESOLVE_GRACE = float(os.getenv("RESOLVE_GRACE", "0.5"))
+
+# Negative cache for unresolvable shares: first suppression window (seconds),
+# doubled on each repeated failure up to the maximum
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "30"))
+NEGATIVE_CACHE_MAX_TTL = int(os.getenv("NEGATIVE_CACHE_MAX_TTL", "1800"))
+NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", "4096"))
+
+# Shared resolution cache in MongoDB for multi-instance deployments; TTL
+# (seconds) applies when no expiry can be read from the links
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+SHARED_CACHE_TTL = int(os.getenv("SHARED_CACHE_TTL", "3600"))
+SHARED_CACHE_POLL_INTERVAL = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", "0.5"))
+
+# Background link refresher: every interval, re-resolve the top videos by
+# access count over the window whose links expire within the lead time
+# (seconds; budget is re-resolutions per cycle)
+LINK_REFRESH_ENABLED = os.getenv("LINK_REFRESH_ENABLED", "true").lower() == "true"
+LINK_REFRESH_INTERVAL = int(os.getenv("LINK_REFRESH_INTERVAL", "300"))
+LINK_REFRESH_LEAD = int(os.getenv("LINK_REFRESH_LEAD", "900"))
+LINK_REFRESH_WINDOW = int(os.getenv("LINK_REFRESH_WINDOW", "86400"))
+LINK_REFRESH_TOP = int(os.getenv("LINK_REFRESH_TOP", "200"))
+LINK_REFRESH_CONCURRENCY = int(os.getenv("LINK_REFRESH_CONCURRENCY", "3"))
+LINK_REFRESH_BUDGET = int(os.getenv("LINK_REFRESH_BUDGET", "50"))
+
+# /stats counters: cache lifetime and drift reconciliation interval (seconds)
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "10"))
+STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+
+# Write-behind buffer for download records: flush after this many records or
+# seconds; when max records are pending the policy either drops or blocks
+DOWNLOAD_BUFFER_BATCH = int(os.getenv("DOWNLOAD_BUFFER_BATCH", "500"))
+DOWNLOAD_BUFFER_INTERVAL = float(os.getenv("DOWNLOAD_BUFFER_INTERVAL", "2"))
+DOWNLOAD_BUFFER_MAX = int(os.getenv("DOWNLOAD_BUFFER_MAX", "20000"))
+DOWNLOAD_BUFFER_POLICY = os.getenv("DOWNLOAD_BUFFER_POLICY", "drop")
+
+# Read-through cache for video documents by ID (seconds, entries)
+VIDEO_CACHE_TTL = int(os.getenv("VIDEO_CACHE_TTL", "60"))
+VIDEO_CACHE_SIZE = int(os.getenv("VIDEO_CACHE_SIZE", "2048"))
+
+# Entries per /history page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+# Download event rollups: raw events are folded into hourly buckets every
+# interval, once an hour has been closed for the lag (seconds); a run covers
+# at most max hours, and raw events are deleted once rolled up and older than
+# the retention period (days)
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", "600"))
+ROLLUP_LAG = int(os.getenv("ROLLUP_LAG", "300"))
+ROLLUP_MAX_HOURS = int(os.getenv("ROLLUP_MAX_HOURS", "168"))
+DOWNLOADS_RETENTION_DAYS = int(os.getenv("DOWNLOADS_RETENTION_DAYS", "30"))
+
+# Media proxy: relay chunk size (bytes) and upstream timeouts (seconds); the
+# connect timeout also bounds the wait for a free pool connection. Relays
+# and file downloads use their own pool (0 per host means no per-host limit)
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", "65536"))
+MEDIA_CONNECT_TIMEOUT = float(os.getenv("MEDIA_CONNECT_TIMEOUT", "10"))
+MEDIA_READ_TIMEOUT = float(os.getenv("MEDIA_READ_TIMEOUT", "30"))
+MEDIA_POOL_LIMIT = int(os.getenv("MEDIA_POOL_LIMIT", "200"))
+MEDIA_POOL_LIMIT_PER_HOST = int(os.getenv("MEDIA_POOL_LIMIT_PER_HOST", "0"))
+
+# Disk cache for proxied media: aligned segment size and total size bound
+# (bytes); file size and validators are remembered for the meta TTL (seconds)
+MEDIA_CACHE_ENABLED = os.getenv("MEDIA_CACHE_ENABLED", "true").lower() == "true"
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "cache/media")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+MEDIA_SEGMENT_SIZE = int(os.getenv("MEDIA_SEGMENT_SIZE", str(1024 ** 2)))
+MEDIA_META_TTL = int(os.getenv("MEDIA_META_TTL", "3600"))
+
+# Segmented downloader: parallel range requests per file, segment size
+# (bytes), retries per segment, and where finished files are written;
+# abandoned resume files are removed after the TTL, checked every interval
+# (seconds)
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", "8"))
+DOWNLOAD_SEGMENT_SIZE = int(os.getenv("DOWNLOAD_SEGMENT_SIZE", str(8 * 1024 ** 2)))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "cache/downloads")
+DOWNLOAD_PARTIAL_TTL = int(os.getenv("DOWNLOAD_PARTIAL_TTL", "86400"))
+DOWNLOAD_CLEANUP_INTERVAL = int(os.getenv("DOWNLOAD_CLEANUP_INTERVAL", "3600"))
+
+# Telegram uploads: videos fetched and uploaded at once, and the largest file
+# a bot may upload (bytes)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "2"))
+TELEGRAM_UPLOAD_LIMIT = int(os.getenv("TELEGRAM_UPLOAD_LIMIT", str(2000 * 1024 ** 2)))
+
+# Thumbnail proxy: allowed widths (pixels), disk cache bound and largest
+# accepted original (bytes), resize threads and encoder quality
+THUMB_WIDTHS = [int(width) for width in os.getenv("THUMB_WIDTHS", "160,320,480,640,1280").split(",")]
+THUMB_DEFAULT_WIDTH = int(os.getenv("THUMB_DEFAULT_WIDTH", "320"))
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", "cache/thumbnails")
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+THUMB_MAX_SOURCE_BYTES = int(os.getenv("THUMB_MAX_SOURCE_BYTES", str(10 * 1024 ** 2)))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+THUMB_CACHE_MAX_AGE = int(os.getenv("THUMB_CACHE_MAX_AGE", "2592000"))
@@ -0,0 +1,35 @@
+"""
+End-to-end latency budget for TeraBox Bot operations
+"""
+import time
+import asyncio
+import aiohttp
+
+class Deadline:
+    """A fixed point in time that every stage of an operation works towards"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self):
+        """Whether the budget is used up"""
+        return self.remaining() <= 0
+
+    def cap(self, seconds=None):
+        """Shorten a stage timeout to what is left of the budget"""
+        remaining = self.remaining()
+        return remaining if seconds is None else min(seconds, remaining)
+
+    def timeout(self, seconds=None):
+        """aiohttp timeout for a sub-request, raising if nothing is left"""
+        remaining = self.cap(seconds)
+        if remaining <= 0:
+            # A zero ClientTimeout would mean no timeout at all
+            raise asyncio.TimeoutError("Deadline exceeded")
+        return aiohttp.ClientTimeout(total=remaining)
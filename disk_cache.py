@@ -0,0 +1,140 @@
+"""
+Disk-backed caching helpers for TeraBox Bot
+"""
+import os
+import mmap
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class DiskLRU:
+    """Files on disk bounded by total bytes, evicted least recently used first
+
+    Entries are stored under a hash of their key, so any string works as a
+    key. Files left by a previous run are picked up on start, oldest first.
+    """
+
+    def __init__(self, directory, max_bytes, name="disk"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries = OrderedDict()  # file name -> size
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self._load()
+
+    def _load(self):
+        """Index files already in the cache directory"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+            elif entry.name.endswith(".tmp"):
+                # Interrupted write
+                os.unlink(entry.path)
+
+        for _, file_name, size in sorted(files):
+            self._entries[file_name] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _file_name(key):
+        """File name for a key"""
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _path(self, file_name):
+        """Full path of a cache file"""
+        return os.path.join(self.directory, file_name)
+
+    def __contains__(self, key):
+        return self._file_name(key) in self._entries
+
+    def get_path(self, key):
+        """Path of a cached entry, marking it recently used, or None"""
+        file_name = self._file_name(key)
+        if file_name not in self._entries:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(file_name)
+        self.hits += 1
+        return self._path(file_name)
+
+    async def put(self, key, data):
+        """Store bytes under a key, evicting old entries past the size bound"""
+        if len(data) > self.max_bytes:
+            return
+
+        file_name = self._file_name(key)
+        try:
+            await asyncio.to_thread(self._write, self._path(file_name), data)
+        except OSError as e:
+            logger.error(f"Error writing {self.name} cache entry: {e}")
+            return
+
+        self.total_bytes += len(data) - self._entries.get(file_name, 0)
+        self._entries[file_name] = len(data)
+        self._entries.move_to_end(file_name)
+        self._evict()
+
+    @staticmethod
+    def _write(path, data):
+        """Write a file atomically so readers never see a partial entry"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        """Drop least recently used entries until under the size bound"""
+        while self.total_bytes > self.max_bytes and self._entries:
+            file_name, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                # Readers holding the file open or mapped keep their copy
+                os.unlink(self._path(file_name))
+            except FileNotFoundError:
+                pass
+
+    def read(self, path):
+        """Read a whole cached file (for small entries)"""
+        with open(path, "rb") as f:
+            data = f.read()
+        self.bytes_served += len(data)
+        return data
+
+    def read_mapped(self, path, start=0, end=None):
+        """Bytes start..end of a cached file through a read-only memory map
+
+        Blocks on page faults, so call it from a worker thread.
+        """
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            end = len(mapped) if end is None else min(end, len(mapped))
+            data = mapped[start:end]
+        self.bytes_served += len(data)
+        return data
+
+    def stats(self):
+        """Get cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes_served": self.bytes_served,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
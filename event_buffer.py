@@ -0,0 +1,128 @@
+"""
+Write-behind event buffer for TeraBox Bot analytics
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EventBuffer:
+    """Collects events in memory and hands them to flush_func in batches
+
+    A flush happens when max_batch events are waiting or flush_interval
+    seconds have passed. At most max_pending events are held; beyond that
+    the "drop" policy discards new events and the "block" policy makes
+    producers wait for the next flush.
+    """
+
+    def __init__(self, flush_func, max_batch=500, flush_interval=2.0,
+                 max_pending=20000, policy="drop", name="events"):
+        self.flush_func = flush_func
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.policy = policy
+        self.name = name
+        self._events = []
+        self._task = None
+        self._wake = None
+        self._space = None
+        self._flush_lock = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def start(self):
+        """Start the background flusher"""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._space = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, event):
+        """Queue an event; returns False if it was dropped"""
+        self.start()
+
+        if len(self._events) >= self.max_pending:
+            if self.policy != "block":
+                self.dropped += 1
+                return False
+
+            self.blocked += 1
+            self._wake.set()
+            while len(self._events) >= self.max_pending:
+                self._space.clear()
+                await self._space.wait()
+
+        self._events.append(event)
+        self.enqueued += 1
+        if len(self._events) >= self.max_batch:
+            self._wake.set()
+        return True
+
+    async def _run(self):
+        """Flush on size or time until cancelled"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write out everything that is queued"""
+        if self._flush_lock is None:
+            return
+
+        async with self._flush_lock:
+            while self._events:
+                batch = self._events[:self.max_batch]
+                del self._events[:self.max_batch]
+                self._space.set()
+
+                try:
+                    await self.flush_func(batch)
+                    self.flushed += len(batch)
+                    self.flushes += 1
+                except Exception as e:
+                    self.flush_errors += 1
+                    logger.error(f"Error flushing {len(batch)} {self.name}: {e}")
+
+                    # Retry later if there is room, otherwise give the batch up
+                    room = self.max_pending - len(self._events)
+                    if room >= len(batch):
+                        self._events[:0] = batch
+                    else:
+                        self.dropped += len(batch)
+                    break
+
+    async def stop(self):
+        """Stop the flusher and write out what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        """Get buffer counters"""
+        return {
+            "name": self.name,
+            "pending": len(self._events),
+            "max_pending": self.max_pending,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors
+        }
@@ -1,12 +1,16 @@
 """
 Download feature logic for TeraBox Bot
 """
+import os
+import asyncio
 import logging
 from mongodb_config import MongoVideo, MongoDownload
+from segmented_downloader import SegmentedDownload, remove_stale_parts
+from config_vars import DOWNLOAD_DIR, DOWNLOAD_PARTIAL_TTL
 
 logger = logging.getLogger(__name__)
 
-async def get_download_url(video_id: str) -> str:
+async def get_download_url(video_id: str, user_id: int = None) -> str:
     """Get download URL for a video"""
     try:
         video = await MongoVideo.find_by_id(video_id)
@@ -25,7 +29,7 @@ async def get_download_url(video_id: str) -> str:
         if download_urls and len(download_urls) > 0:
             # Log download attempt
             await MongoDownload.create({
-                "user_id": video.get("user_id"),
+                "user_id": user_id,
                 "video_id": video_id,
                 "download_type": "download"
             })
@@ -76,4 +80,58 @@ async def process_download_request(video_id: str, user_id: int, ip_address: str
         
     except Exception as e:
         logger.error(f"Error processing download request: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# In-progress file downloads by video ID, so concurrent callers share one
+active_downloads = {}
+
+async def fetch_video_file(video_id: str, progress=None):
+    """Download a video's file to local disk and return its path"""
+    task = active_downloads.get(video_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_video_file(video_id, progress))
+        active_downloads[video_id] = task
+        task.add_done_callback(lambda t: active_downloads.pop(video_id, None))
+    
+    # Shield so one cancelled caller does not abort the download for the others
+    return await asyncio.shield(task)
+
+async def _fetch_video_file(video_id: str, progress=None):
+    """Run the segmented download for one video"""
+    video = await MongoVideo.find_by_id(video_id)
+    download_urls = await get_all_download_urls(video_id) if video else []
+    if not download_urls:
+        return None
+    
+    extension = os.path.splitext(video.get("title") or "")[1] or ".mp4"
+    path = os.path.join(DOWNLOAD_DIR, f"{video_id}{extension}")
+    if os.path.exists(path):
+        return path
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    
+    async def refresh_url():
+        """Re-resolve the share when the direct link has expired"""
+        from terabox_scraper import TeraBoxScraper
+        video_info = await TeraBoxScraper().extract_video_info(video["original_url"], force_refresh=True)
+        if not video_info or video_info.get("partial") or not video_info.get("download_urls"):
+            return None
+        await MongoVideo.update_links(video_id, video_info)
+        return video_info["download_urls"][0]
+    
+    download = SegmentedDownload(download_urls[0], path, progress=progress, refresh_url=refresh_url)
+    try:
+        return await download.run()
+    except asyncio.CancelledError:
+        # Interrupted, e.g. by shutdown: keep the resume point
+        raise
+    except Exception:
+        # Failed for good after retries; a resume point would only take disk
+        download.discard()
+        raise
+
+async def cleanup_partial_downloads():
+    """Remove resume files of downloads abandoned for DOWNLOAD_PARTIAL_TTL"""
+    removed = await asyncio.to_thread(remove_stale_parts, DOWNLOAD_DIR, DOWNLOAD_PARTIAL_TTL)
+    if removed:
+        logger.info(f"Removed {removed} abandoned partial download files")
+    return removed
@@ -3,7 +3,7 @@ Info feature logic for TeraBox Bot
 """
 import logging
 from utils import format_file_size
-from mongodb_config import MongoVideo
+from mongodb_config import MongoVideo, MongoSubmission
 
 logger = logging.getLogger(__name__)
 
@@ -71,7 +71,7 @@ async def check_video_exists(video_id: str, user_id: int = None):
         if not video:
             return False
         
-        if user_id and video.get("user_id") != user_id:
+        if user_id and not await MongoSubmission.has_access(user_id, video_id):
             return False
         
         return True
@@ -0,0 +1,344 @@
+"""
+Media proxy feature logic for TeraBox Bot
+"""
+import re
+import asyncio
+import logging
+import aiohttp
+from mongodb_config import MongoVideo
+from http_client import media_pool, DEFAULT_HEADERS
+from cache import TTLCache
+from disk_cache import DiskLRU
+from config_vars import (
+    MEDIA_CHUNK_SIZE, MEDIA_CONNECT_TIMEOUT, MEDIA_READ_TIMEOUT, MEDIA_CACHE_ENABLED,
+    MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_SEGMENT_SIZE, MEDIA_META_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+# Upstream response headers passed on to the player
+RELAYED_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+
+# Ranges only make sense on the raw bytes, so never ask for compression
+MEDIA_HEADERS = {**DEFAULT_HEADERS, "Accept-Encoding": "identity"}
+
+# No total limit: a stream lasts as long as the viewer watches
+MEDIA_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, connect=MEDIA_CONNECT_TIMEOUT, sock_connect=MEDIA_CONNECT_TIMEOUT, sock_read=MEDIA_READ_TIMEOUT
+)
+
+media_stats = {"requests": 0, "partial": 0, "sliced": 0, "bytes_relayed": 0, "upstream_errors": 0, "aborted": 0}
+
+# Segments of popular files on local disk, keyed by video ID and aligned
+# segment index, plus what is known about each upstream file
+segment_cache = DiskLRU(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, name="media_segments") if MEDIA_CACHE_ENABLED else None
+media_meta = TTLCache(maxsize=4096, ttl=MEDIA_META_TTL, name="media_meta")
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+class RangeNotSatisfiable(Exception):
+    """The requested range starts past the end of the file"""
+
+class UpstreamError(Exception):
+    """The upstream file could not be fetched"""
+    
+    def __init__(self, status):
+        super().__init__(f"Upstream returned {status}")
+        self.status = status
+
+def parse_range(range_header, size):
+    """Parse a single ``bytes=`` range into inclusive (start, end)
+    
+    Returns None when the header is malformed or has several ranges; the
+    full file is served in that case. Raises RangeNotSatisfiable when the
+    range lies wholly past the end of the file.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix == 0:
+                raise RangeNotSatisfiable()
+            start = max(size - suffix, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def media_url(video):
+    """Upstream URL to relay for a video"""
+    download_urls = video.get("download_urls") or []
+    return video.get("video_url") or (download_urls[0] if download_urls else None)
+
+async def open_media(video_id: str, range_header: str = None, if_range: str = None):
+    """Open the upstream file for a video
+    
+    Returns (status, headers, body) where body is an async iterator of
+    chunks, or None if the video or its link is unknown. Raises
+    UpstreamError if the upstream refuses the request.
+    """
+    video = await MongoVideo.find_by_id(video_id)
+    url = media_url(video) if video else None
+    if not url:
+        return None
+    
+    media_stats["requests"] += 1
+    meta = media_meta.get(video_id)
+    if segment_cache is not None and meta is not None:
+        return await open_cached(video_id, url, meta, range_header, if_range)
+    
+    headers = dict(MEDIA_HEADERS)
+    if range_header:
+        headers["Range"] = range_header
+    if if_range:
+        headers["If-Range"] = if_range
+    
+    session = await media_pool.get_session()
+    upstream = await session.get(url, headers=headers, timeout=MEDIA_TIMEOUT)
+    
+    if upstream.status not in (200, 206, 416):
+        upstream.close()
+        media_stats["upstream_errors"] += 1
+        raise UpstreamError(upstream.status)
+    
+    status = upstream.status
+    response_headers = {name: upstream.headers[name] for name in RELAYED_HEADERS if name in upstream.headers}
+    response_headers.setdefault("Accept-Ranges", "bytes")
+    
+    if status == 416:
+        # The upstream error body is not relayed, so neither is its length
+        upstream.close()
+        response_headers.pop("Content-Length", None)
+        return status, response_headers, empty_body()
+    
+    remember_meta(video_id, upstream)
+    
+    skip, length = 0, None
+    if status == 200 and range_header and not if_range and upstream.content_length:
+        # Upstream ignored the range; cut it out of the full body ourselves.
+        # With If-Range a 200 means the validator failed, so the full file is right.
+        try:
+            byte_range = parse_range(range_header, upstream.content_length)
+        except RangeNotSatisfiable:
+            upstream.close()
+            response_headers = {"Accept-Ranges": "bytes", "Content-Range": f"bytes */{upstream.content_length}"}
+            return 416, response_headers, empty_body()
+        if byte_range:
+            start, end = byte_range
+            skip, length = start, end - start + 1
+            status = 206
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{upstream.content_length}"
+            response_headers["Content-Length"] = str(length)
+            media_stats["sliced"] += 1
+    
+    if status == 206:
+        media_stats["partial"] += 1
+    
+    return status, response_headers, relay(upstream, skip, length)
+
+def remember_meta(video_id, upstream):
+    """Record size and validators of a file whose upstream serves ranges"""
+    size = None
+    if upstream.status == 206:
+        match = CONTENT_RANGE_PATTERN.match(upstream.headers.get("Content-Range", ""))
+        size = int(match.group(3)) if match else None
+    elif upstream.headers.get("Accept-Ranges") == "bytes":
+        size = upstream.content_length
+    
+    if size:
+        media_meta.set(video_id, {
+            "size": size,
+            **{name: upstream.headers[name] for name in ("Content-Type", "ETag", "Last-Modified") if name in upstream.headers}
+        })
+
+async def open_cached(video_id, url, meta, range_header=None, if_range=None):
+    """Serve a request from the segment cache, filling gaps from upstream
+
+    If the first segment is not cached its upstream request is made here,
+    so an upstream failure becomes an error response rather than a body
+    cut short after the headers were sent.
+    """
+    size = meta["size"]
+    headers = {name: meta[name] for name in ("Content-Type", "ETag", "Last-Modified") if name in meta}
+    headers["Accept-Ranges"] = "bytes"
+    
+    # A failed If-Range validator means the whole current file
+    byte_range = None
+    if range_header and (not if_range or if_range in (meta.get("ETag"), meta.get("Last-Modified"))):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return 416, {"Accept-Ranges": "bytes", "Content-Range": f"bytes */{size}"}, empty_body()
+    
+    if byte_range:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        media_stats["partial"] += 1
+    else:
+        start, end = 0, size - 1
+        status = 200
+    headers["Content-Length"] = str(end - start + 1)
+    
+    first_fill = None
+    first = start // MEDIA_SEGMENT_SIZE
+    if segment_key(video_id, first) not in segment_cache:
+        run_last = missing_run(video_id, first, end // MEDIA_SEGMENT_SIZE)
+        first_fill = run_last, await open_fill(video_id, url, size, first, run_last)
+    
+    return status, headers, cached_body(video_id, url, size, start, end, first_fill)
+
+def segment_key(video_id, index):
+    """Cache key of one aligned segment"""
+    return f"{video_id}:{MEDIA_SEGMENT_SIZE}:{index}"
+
+def missing_run(video_id, index, last):
+    """Last index of the run of uncached segments starting at index"""
+    run_last = index
+    while run_last < last and segment_key(video_id, run_last + 1) not in segment_cache:
+        run_last += 1
+    return run_last
+
+async def cached_body(video_id, url, size, start, end, first_fill=None):
+    """Yield bytes start..end, from disk where cached and upstream otherwise
+
+    ``first_fill`` is (last index, opened upstream response) for a run of
+    missing segments at the start that open_cached already requested.
+    """
+    index = start // MEDIA_SEGMENT_SIZE
+    last = end // MEDIA_SEGMENT_SIZE
+    while index <= last:
+        segment_start = index * MEDIA_SEGMENT_SIZE
+        if first_fill is not None:
+            (run_last, upstream), first_fill = first_fill, None
+            segment_cache.misses += 1
+        else:
+            path = segment_cache.get_path(segment_key(video_id, index))
+            if path:
+                offset = max(start, segment_start) - segment_start
+                stop = min(end + 1, segment_start + MEDIA_SEGMENT_SIZE) - segment_start
+                try:
+                    # Page faults on a cold file would stall the event loop
+                    data = await asyncio.to_thread(segment_cache.read_mapped, path, offset, stop)
+                except FileNotFoundError:
+                    data = None  # evicted between lookup and read
+                if data is not None:
+                    view = memoryview(data)
+                    for position in range(0, len(view), MEDIA_CHUNK_SIZE):
+                        yield bytes(view[position:position + MEDIA_CHUNK_SIZE])
+                    index += 1
+                    continue
+            
+            # Fetch the whole run of missing segments with one upstream request
+            run_last = missing_run(video_id, index, last)
+            upstream = await open_fill(video_id, url, size, index, run_last)
+        
+        segment_cache.misses += run_last - index
+        fill = fill_segments(video_id, upstream, size, index, start, end)
+        try:
+            async for chunk in fill:
+                yield chunk
+        finally:
+            # Close at once on disconnect so the upstream read stops now
+            await fill.aclose()
+        index = run_last + 1
+
+async def open_fill(video_id, url, size, first, last):
+    """Request aligned segments first..last from upstream"""
+    fetch_start = first * MEDIA_SEGMENT_SIZE
+    fetch_end = min((last + 1) * MEDIA_SEGMENT_SIZE, size) - 1
+    headers = {**MEDIA_HEADERS, "Range": f"bytes={fetch_start}-{fetch_end}"}
+    
+    session = await media_pool.get_session()
+    upstream = await session.get(url, headers=headers, timeout=MEDIA_TIMEOUT)
+    if upstream.status != 206:
+        upstream.close()
+        media_stats["upstream_errors"] += 1
+        media_meta.invalidate(video_id)
+        raise UpstreamError(upstream.status)
+    return upstream
+
+async def fill_segments(video_id, upstream, size, first, start, end):
+    """Read aligned segments from an opened upstream, caching them and yielding the requested part"""
+    position = first * MEDIA_SEGMENT_SIZE
+    index = first
+    segment = bytearray()
+    finished = False
+    try:
+        async for chunk in upstream.content.iter_chunked(MEDIA_CHUNK_SIZE):
+            low = max(start, position)
+            high = min(end + 1, position + len(chunk))
+            if low < high:
+                media_stats["bytes_relayed"] += high - low
+                yield chunk[low - position:high - position]
+            position += len(chunk)
+            
+            segment += chunk
+            segment_length = min(MEDIA_SEGMENT_SIZE, size - index * MEDIA_SEGMENT_SIZE)
+            while len(segment) >= segment_length > 0:
+                await segment_cache.put(segment_key(video_id, index), bytes(segment[:segment_length]))
+                del segment[:segment_length]
+                index += 1
+                segment_length = min(MEDIA_SEGMENT_SIZE, size - index * MEDIA_SEGMENT_SIZE)
+        finished = True
+    finally:
+        if finished:
+            upstream.release()
+        else:
+            # A partly received segment is dropped; complete ones stay cached
+            media_stats["aborted"] += 1
+            upstream.close()
+
+async def empty_body():
+    """Body for responses without content"""
+    return
+    yield
+
+async def relay(upstream, skip=0, length=None):
+    """Yield fixed-size chunks as the client consumes them
+    
+    Each chunk is only read from upstream after the previous one was sent,
+    so a slow client slows the upstream read instead of filling memory. If
+    the client goes away the generator is closed and the upstream
+    connection is dropped at once.
+    """
+    finished = False
+    try:
+        async for chunk in upstream.content.iter_chunked(MEDIA_CHUNK_SIZE):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            
+            if length is not None:
+                chunk = chunk[:length]
+                length -= len(chunk)
+            
+            media_stats["bytes_relayed"] += len(chunk)
+            yield chunk
+            
+            if length == 0:
+                break
+        finished = True
+    finally:
+        if finished and upstream.content.at_eof():
+            upstream.release()
+        else:
+            # Client gone or range done early: drop the connection, do not drain it
+            if not finished:
+                media_stats["aborted"] += 1
+            upstream.close()
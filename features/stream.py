@@ -6,7 +6,7 @@ from mongodb_config import MongoVideo, MongoDownload
 
 logger = logging.getLogger(__name__)
 
-async def get_video_by_id(video_id: str):
+async def get_video_by_id(video_id: str, user_id: int = None):
     """Get video data by ID for streaming"""
     try:
         video = await MongoVideo.find_by_id(video_id)
@@ -15,7 +15,7 @@ async def get_video_by_id(video_id: str):
         
         # Log stream access
         await MongoDownload.create({
-            "user_id": video.get("user_id"),
+            "user_id": user_id,
             "video_id": video_id,
             "download_type": "stream"
         })
@@ -71,23 +71,21 @@ async def process_stream_request(video_id: str, user_id: int, ip_address: str =
 async def get_video_stats(video_id: str):
     """Get streaming statistics for a video"""
     try:
-        from mongodb_config import downloads_collection
-        
-        total_streams = await downloads_collection.count_documents({
-            "video_id": video_id,
-            "download_type": "stream"
-        })
-        
-        total_downloads = await downloads_collection.count_documents({
-            "video_id": video_id,
-            "download_type": "download"
-        })
-        
-        return {
-            "total_streams": total_streams,
-            "total_downloads": total_downloads
-        }
+        stats = await MongoDownload.batch_stats([video_id])
+        return stats[video_id]
         
     except Exception as e:
         logger.error(f"Error getting video stats for {video_id}: {e}")
-        return {"total_streams": 0, "total_downloads": 0}
\ No newline at end of file
+        return {"total_streams": 0, "total_downloads": 0}
+
+async def get_batch_video_stats(video_ids: list = None, top_k: int = None, hours: int = None):
+    """Get streaming statistics for many videos, or the top K, in one query"""
+    from datetime import datetime, timedelta
+    
+    try:
+        since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+        return await MongoDownload.batch_stats(video_ids, since=since, top_k=top_k)
+        
+    except Exception as e:
+        logger.error(f"Error getting batch video stats: {e}")
+        return {}
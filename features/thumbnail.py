@@ -0,0 +1,152 @@
+"""
+Thumbnail proxy feature logic for TeraBox Bot
+"""
+import io
+import asyncio
+import logging
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from mongodb_config import MongoVideo
+from http_client import http_pool, DEFAULT_HEADERS
+from cache import TTLCache
+from disk_cache import DiskLRU
+from config_vars import (
+    THUMB_CACHE_DIR, THUMB_CACHE_MAX_BYTES, THUMB_WIDTHS, THUMB_DEFAULT_WIDTH,
+    THUMB_WORKERS, THUMB_MAX_SOURCE_BYTES, THUMB_QUALITY
+)
+
+logger = logging.getLogger(__name__)
+
+# Originals and resized variants on disk, bounded by total bytes
+thumb_cache = DiskLRU(THUMB_CACHE_DIR, THUMB_CACHE_MAX_BYTES, name="thumbnails")
+
+# Single-flight only (nothing is kept in memory): one fetch or resize per key
+thumb_loads = TTLCache(maxsize=0, name="thumbnail_loads")
+
+# Resizing is CPU bound; Pillow releases the GIL for most of it
+thumb_executor = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+
+THUMB_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Background prefetches, kept referenced until they finish
+prefetch_tasks = set()
+
+class ThumbnailError(Exception):
+    """The original thumbnail could not be fetched or decoded"""
+
+def snap_width(width):
+    """Closest allowed width, so only a few variants exist per video"""
+    if not width:
+        return THUMB_DEFAULT_WIDTH
+    return min(THUMB_WIDTHS, key=lambda allowed: abs(allowed - width))
+
+def pick_format(accept_header):
+    """WebP for clients that accept it, JPEG otherwise"""
+    return "webp" if "image/webp" in (accept_header or "") else "jpeg"
+
+def resize_image(data, width, image_format):
+    """Decode, shrink (never enlarge) and encode one variant"""
+    with Image.open(io.BytesIO(data)) as image:
+        # Let JPEG decode at a reduced scale when much larger than needed
+        image.draft("RGB", (width, width * image.height // max(image.width, 1)))
+        if image.width > width:
+            height = max(round(image.height * width / image.width), 1)
+            image = image.resize((width, height), Image.LANCZOS)
+        
+        if image_format == "jpeg" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        
+        output = io.BytesIO()
+        if image_format == "webp":
+            image.save(output, "WEBP", quality=THUMB_QUALITY, method=4)
+        else:
+            image.save(output, "JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+        return output.getvalue()
+
+async def load_cached(key):
+    """Bytes of a cached entry, or None"""
+    path = thumb_cache.get_path(key)
+    if path is None:
+        return None
+    try:
+        return await asyncio.to_thread(thumb_cache.read, path)
+    except FileNotFoundError:
+        # Evicted between lookup and read
+        return None
+
+async def fetch_original(video_id, thumbnail_url):
+    """Original thumbnail bytes, fetched from upstream only once"""
+    key = f"{video_id}:original"
+    data = await load_cached(key)
+    if data is not None:
+        return data
+    
+    session = await http_pool.get_session()
+    try:
+        async with session.get(thumbnail_url, headers=DEFAULT_HEADERS, timeout=THUMB_TIMEOUT) as response:
+            if response.status != 200:
+                raise ThumbnailError(f"Upstream returned {response.status}")
+            if response.content_length and response.content_length > THUMB_MAX_SOURCE_BYTES:
+                raise ThumbnailError("Original thumbnail too large")
+            data = await response.content.read(THUMB_MAX_SOURCE_BYTES + 1)
+            if len(data) > THUMB_MAX_SOURCE_BYTES:
+                raise ThumbnailError("Original thumbnail too large")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ThumbnailError(f"Cannot fetch thumbnail: {e}")
+    
+    await thumb_cache.put(key, data)
+    return data
+
+async def build_variant(video_id, thumbnail_url, width, image_format):
+    """Resized variant bytes, from disk or made from the original"""
+    key = f"{video_id}:{width}:{image_format}"
+    data = await load_cached(key)
+    if data is not None:
+        return data
+    
+    original = await thumb_loads.get_or_load(
+        f"{video_id}:original",
+        lambda: fetch_original(video_id, thumbnail_url)
+    )
+    try:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(thumb_executor, resize_image, original, width, image_format)
+    except Exception as e:
+        raise ThumbnailError(f"Cannot resize thumbnail: {e}")
+    
+    await thumb_cache.put(key, data)
+    return data
+
+async def get_thumbnail(video_id: str, width: int = None, accept: str = None):
+    """Get (bytes, media type, etag) for a video thumbnail, or None if it has none"""
+    video = await MongoVideo.find_by_id(video_id)
+    thumbnail_url = video.get("thumbnail_url") if video else None
+    if not thumbnail_url:
+        return None
+    
+    width = snap_width(width)
+    image_format = pick_format(accept)
+    key = f"{video_id}:{width}:{image_format}"
+    data = await thumb_loads.get_or_load(
+        key,
+        lambda: build_variant(video_id, thumbnail_url, width, image_format)
+    )
+    return data, MEDIA_TYPES[image_format], f'"{key}"'
+
+async def prefetch_thumbnail(video_id: str):
+    """Warm the default variants right after a video is resolved"""
+    for image_format in MEDIA_TYPES:
+        try:
+            await get_thumbnail(video_id, THUMB_DEFAULT_WIDTH, MEDIA_TYPES[image_format])
+        except Exception as e:
+            logger.error(f"Error prefetching thumbnail for {video_id}: {e}")
+            return
+
+def schedule_prefetch(video_id: str):
+    """Start a background thumbnail prefetch"""
+    task = asyncio.create_task(prefetch_thumbnail(video_id))
+    prefetch_tasks.add(task)
+    task.add_done_callback(prefetch_tasks.discard)
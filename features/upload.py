@@ -0,0 +1,139 @@
+"""
+Telegram upload feature logic for TeraBox Bot
+"""
+import os
+import time
+import asyncio
+import logging
+from mongodb_config import MongoVideo
+from features.download import fetch_video_file
+from utils import format_file_size
+from config_vars import UPLOAD_CONCURRENCY, TELEGRAM_UPLOAD_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Global cap on videos being fetched and uploaded at once
+upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+# In-progress uploads by video ID, so concurrent requests share one
+active_uploads = {}
+
+upload_stats = {"resent": 0, "uploaded": 0, "coalesced": 0, "failed": 0}
+
+# Sends started from bot handlers, kept referenced until they finish
+send_tasks = set()
+
+def progress_reporter(status_message, label, interval=3.0):
+    """Progress callback editing a status message, rate limited against flood waits"""
+    last_edit = [0.0]
+    
+    async def report(current, total, *args):
+        now = time.monotonic()
+        if status_message is None or not total or now - last_edit[0] < interval:
+            return
+        last_edit[0] = now
+        
+        text = f"{label} {current * 100 // total}%\n\n{format_file_size(current)} / {format_file_size(total)}"
+        if args:
+            text += f"\n⚡ {format_file_size(int(args[0]))}/s"
+        try:
+            await status_message.edit_text(text)
+        except Exception as e:
+            logger.error(f"Failed to update progress message: {e}")
+    
+    return report
+
+def video_caption(video):
+    """Caption for a sent video"""
+    return f"🎬 {video.get('title', 'Unknown Title')}\n📏 {format_file_size(video.get('file_size', 0))}"
+
+async def send_video_to_chat(client, video_id: str, chat_id: int, status_message=None):
+    """Send a video into a chat, re-using its Telegram file_id when there is one
+    
+    Returns True when the video was sent.
+    """
+    video = await MongoVideo.find_by_id(video_id)
+    if not video:
+        return False
+    
+    file_id = video.get("telegram_file_id")
+    if file_id:
+        try:
+            await client.send_video(chat_id, file_id, caption=video_caption(video))
+            upload_stats["resent"] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Stored file_id for {video_id} failed, uploading again: {e}")
+    
+    task = active_uploads.get(video_id)
+    if task is not None:
+        # Someone else is uploading this video; send their file_id once it exists
+        upload_stats["coalesced"] += 1
+        if status_message is not None:
+            await status_message.edit_text("⏳ This video is already being uploaded. It will be sent here when ready.")
+        file_id = await asyncio.shield(task)
+        if not file_id:
+            return False
+        await client.send_video(chat_id, file_id, caption=video_caption(video))
+        return True
+    
+    task = asyncio.ensure_future(upload_video(client, video, chat_id, status_message))
+    active_uploads[video_id] = task
+    task.add_done_callback(lambda t: active_uploads.pop(video_id, None))
+    return bool(await asyncio.shield(task))
+
+async def upload_video(client, video, chat_id: int, status_message=None):
+    """Fetch a video and upload it to a chat; returns the stored file_id"""
+    video_id = str(video["_id"])
+    if video.get("file_size", 0) > TELEGRAM_UPLOAD_LIMIT:
+        return None
+    
+    async with upload_semaphore:
+        path = None
+        try:
+            path = await fetch_video_file(video_id, progress=progress_reporter(status_message, "📥 Downloading..."))
+            if not path or os.path.getsize(path) > TELEGRAM_UPLOAD_LIMIT:
+                return None
+            
+            message = await client.send_video(
+                chat_id, path,
+                caption=video_caption(video),
+                supports_streaming=True,
+                progress=progress_reporter(status_message, "📤 Uploading...")
+            )
+            media = message.video or message.document
+            await MongoVideo.set_file_id(video_id, media.file_id)
+            upload_stats["uploaded"] += 1
+            return media.file_id
+        except Exception as e:
+            upload_stats["failed"] += 1
+            logger.error(f"Error uploading video {video_id}: {e}")
+            return None
+        finally:
+            # Later sends use the file_id, so the local copy is not needed
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+async def deliver_video(client, video_id: str, chat_id: int, status_message):
+    """Send a video and report the outcome in the status message"""
+    try:
+        sent = await send_video_to_chat(client, video_id, chat_id, status_message)
+        text = "✅ Video sent!" if sent else "❌ Could not send this video. Please use the download links instead."
+    except Exception as e:
+        logger.error(f"Error sending video {video_id}: {e}")
+        text = "❌ Error sending video. Please try again later."
+    
+    try:
+        await status_message.edit_text(text)
+    except Exception as e:
+        logger.error(f"Failed to update send status message: {e}")
+
+def schedule_send(client, video_id: str, chat_id: int, status_message):
+    """Start a send in the background so the bot handler returns at once
+    
+    Handlers run on a small fixed pool of dispatcher workers; a download
+    and upload lasting minutes would otherwise block other updates.
+    """
+    task = asyncio.create_task(deliver_video(client, video_id, chat_id, status_message))
+    send_tasks.add(task)
+    task.add_done_callback(send_tasks.discard)
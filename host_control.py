@@ -0,0 +1,189 @@
+"""
+Per-host adaptive concurrency limits and circuit breakers for TeraBox Bot
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import aiohttp
+from config_vars import (
+    HOST_INITIAL_LIMIT, HOST_MIN_LIMIT, HOST_MAX_LIMIT, HOST_LATENCY_TARGET,
+    HOST_DECREASE_FACTOR, HOST_BREAKER_THRESHOLD, HOST_BREAKER_COOLDOWN
+)
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the host is throttling or failing us
+FAILURE_STATUSES = {403, 429}
+
+# Exceptions that count against a host; anything else is the caller's problem
+FAILURE_EXCEPTIONS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+class CircuitOpenError(Exception):
+    """Raised when a host's circuit breaker is rejecting requests"""
+
+class RequestSlot:
+    """Outcome of one request made through a HostController"""
+
+    def __init__(self):
+        self.status = None
+
+    def record_status(self, status):
+        """Remember the response status for the controller"""
+        self.status = status
+
+class HostController:
+    """AIMD concurrency limit and circuit breaker for one host"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host):
+        self.host = host
+        self.limit = float(HOST_INITIAL_LIMIT)
+        self.in_flight = 0
+        self._waiters = deque()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latency = 0.0
+
+    def _admit(self):
+        """Check the breaker; return True if this request is the half-open probe"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < HOST_BREAKER_COOLDOWN:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {self.host}")
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit half-open for {self.host}, probe in flight")
+            self.probe_in_flight = True
+            return True
+
+        return False
+
+    async def _acquire(self):
+        """Wait for a free slot under the current limit"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done():
+                    # We were woken but will not use the slot; pass it on
+                    self._wake()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        self.in_flight += 1
+
+    def _wake(self):
+        """Wake as many waiters as there are free slots"""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _record(self, failed, latency, probe):
+        """Adjust the limit and the breaker from one outcome"""
+        slow = latency > HOST_LATENCY_TARGET
+        if failed or slow:
+            # Multiplicative decrease
+            self.limit = max(HOST_MIN_LIMIT, self.limit * HOST_DECREASE_FACTOR)
+        else:
+            # Additive increase, roughly one slot per window of successes
+            self.limit = min(HOST_MAX_LIMIT, self.limit + 1.0 / self.limit)
+
+        if failed:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if probe or self.consecutive_failures >= HOST_BREAKER_THRESHOLD:
+                if self.state != self.OPEN:
+                    logger.warning(f"Opening circuit for {self.host} after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+        else:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.latency += 0.2 * (latency - self.latency)
+            if probe:
+                logger.info(f"Closing circuit for {self.host}")
+                self.state = self.CLOSED
+
+    @asynccontextmanager
+    async def slot(self):
+        """Run one request under the host's limit and breaker"""
+        probe = self._admit()
+        try:
+            await self._acquire()
+        except BaseException:
+            if probe:
+                self.probe_in_flight = False
+            raise
+
+        request = RequestSlot()
+        started = time.monotonic()
+        failed = None
+        try:
+            yield request
+            failed = request.status is not None and (
+                request.status in FAILURE_STATUSES or request.status >= 500
+            )
+        except FAILURE_EXCEPTIONS:
+            failed = True
+            raise
+        finally:
+            self.in_flight -= 1
+            if probe:
+                self.probe_in_flight = False
+            # Cancellations and caller errors say nothing about the host
+            if failed is not None:
+                self._record(failed, time.monotonic() - started, probe)
+            elif probe and self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+            self._wake()
+
+    def stats(self):
+        """Get limiter and breaker state"""
+        return {
+            "state": self.state,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "latency": round(self.latency, 4)
+        }
+
+host_controllers = {}
+
+def get_host_controller(url):
+    """Get the controller for a URL's host"""
+    host = (urlparse(url).hostname or '').lower()
+    controller = host_controllers.get(host)
+    if controller is None:
+        controller = host_controllers[host] = HostController(host)
+    return controller
+
+def host_slot(url):
+    """Context manager guarding one request to the URL's host"""
+    return get_host_controller(url).slot()
+
+def host_stats():
+    """Get the state of every known host"""
+    return {host: controller.stats() for host, controller in host_controllers.items()}
@@ -0,0 +1,138 @@
+"""
+Shared HTTP client pool for TeraBox Bot
+"""
+import time
+import inspect
+import logging
+import aiohttp
+from config_vars import (
+    HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_TTL, HTTP_HAPPY_EYEBALLS_DELAY, HTTP_TIMEOUT,
+    MEDIA_POOL_LIMIT, MEDIA_POOL_LIMIT_PER_HOST
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+class HttpClientPool:
+    """One aiohttp session and connector shared by the whole process"""
+
+    def __init__(self, limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT_PER_HOST):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.session = None
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.queued = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def _trace_config(self):
+        """Trace hooks feeding the pool statistics"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+
+        async def on_queued_end(session, ctx, params):
+            wait = time.monotonic() - ctx.queued_at
+            self.queued += 1
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+
+        async def on_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_hit(session, ctx, params):
+            self.dns_hits += 1
+
+        async def on_dns_miss(session, ctx, params):
+            self.dns_misses += 1
+
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_dns_cache_hit.append(on_dns_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_miss)
+        return trace_config
+
+    def _connector(self):
+        """Build the tuned TCP connector"""
+        options = {
+            'ssl': False,
+            'limit': self.limit,
+            'limit_per_host': self.limit_per_host,
+            'keepalive_timeout': HTTP_KEEPALIVE_TIMEOUT,
+            'ttl_dns_cache': HTTP_DNS_TTL,
+            'use_dns_cache': HTTP_DNS_TTL > 0,
+        }
+
+        # Happy eyeballs is only tunable on newer aiohttp releases
+        if HTTP_HAPPY_EYEBALLS_DELAY > 0:
+            if 'happy_eyeballs_delay' in inspect.signature(aiohttp.TCPConnector).parameters:
+                options['happy_eyeballs_delay'] = HTTP_HAPPY_EYEBALLS_DELAY
+            else:
+                logger.warning("Installed aiohttp does not support happy eyeballs, ignoring HTTP_HAPPY_EYEBALLS_DELAY")
+
+        return aiohttp.TCPConnector(**options)
+
+    async def get_session(self):
+        """Get or create the shared aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=DEFAULT_HEADERS,
+                connector=self._connector(),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+                trace_configs=[self._trace_config()]
+            )
+        return self.session
+
+    async def close(self):
+        """Close the shared session and its connections"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def stats(self):
+        """Get pool occupancy and wait-time statistics"""
+        in_use = idle = 0
+        if self.session is not None and not self.session.closed:
+            connector = self.session.connector
+            # aiohttp keeps no public counters for these
+            in_use = len(getattr(connector, '_acquired', ()))
+            idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "in_use": in_use,
+            "idle": idle,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "queued": self.queued,
+            "queue_wait_avg": round(self.queue_wait_total / self.queued, 4) if self.queued else 0.0,
+            "queue_wait_max": round(self.queue_wait_max, 4),
+            "dns_cache_hits": self.dns_hits,
+            "dns_cache_misses": self.dns_misses
+        }
+
+# Process-wide pool shared by the bot handlers and the web routes
+http_pool = HttpClientPool()
+
+# Separate pool for media relays and file downloads: these hold a connection
+# for minutes, so they must not take the slots link resolution needs
+media_pool = HttpClientPool(limit=MEDIA_POOL_LIMIT, limit_per_host=MEDIA_POOL_LIMIT_PER_HOST)
@@ -0,0 +1,129 @@
+"""
+Background refresher for expiring direct links of popular videos
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from mongodb_config import MongoVideo, MongoDownload, videos_collection
+from utils import extract_terabox_id, link_expiry
+from config_vars import (
+    LINK_REFRESH_INTERVAL, LINK_REFRESH_LEAD, LINK_REFRESH_WINDOW,
+    LINK_REFRESH_TOP, LINK_REFRESH_CONCURRENCY, LINK_REFRESH_BUDGET
+)
+
+logger = logging.getLogger(__name__)
+
+class LinkRefresher:
+    """Re-resolves the most accessed videos shortly before their links expire"""
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self._task = None
+        self.cycles = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.last_run = None
+
+    def start(self):
+        """Start the refresh loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the refresh loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Refresh on a fixed interval until cancelled"""
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.error(f"Link refresh cycle failed: {e}")
+            await asyncio.sleep(LINK_REFRESH_INTERVAL)
+
+    async def _hot_video_ids(self):
+        """Most accessed video IDs over the access window"""
+        since = datetime.utcnow() - timedelta(seconds=LINK_REFRESH_WINDOW)
+        stats = await MongoDownload.batch_stats(since=since, top_k=LINK_REFRESH_TOP)
+        return [video_id for video_id in stats if video_id and ObjectId.is_valid(video_id)]
+
+    async def refresh_once(self):
+        """Run one refresh cycle"""
+        self.cycles += 1
+        self.last_run = datetime.utcnow()
+
+        hot_ids = await self._hot_video_ids()
+        if not hot_ids:
+            return
+
+        object_ids = [ObjectId(video_id) for video_id in hot_ids]
+        await self._backfill_expiry(object_ids)
+
+        # Expiry stored when the links were written; keep popularity order
+        refresh_before = datetime.utcnow() + timedelta(seconds=LINK_REFRESH_LEAD)
+        cursor = videos_collection.find(
+            {"_id": {"$in": object_ids}, "links_expire_at": {"$lte": refresh_before}},
+            {"share_id": 1, "original_url": 1, "links_expire_at": 1}
+        )
+        videos = {str(video["_id"]): video async for video in cursor}
+
+        shares = {}  # share ID -> (original URL, [video IDs])
+        for video_id in hot_ids:
+            video = videos.get(video_id)
+            if not video or not video.get("original_url"):
+                continue
+
+            # Canonical videos carry their share ID; legacy ones are derived
+            share_id = video.get("share_id") or extract_terabox_id(video["original_url"]) or video["original_url"]
+            shares.setdefault(share_id, (video["original_url"], []))[1].append(video_id)
+
+        # Request budget: the hottest shares first
+        semaphore = asyncio.Semaphore(LINK_REFRESH_CONCURRENCY)
+        jobs = list(shares.values())[:LINK_REFRESH_BUDGET]
+        await asyncio.gather(*(self._refresh(semaphore, url, video_ids) for url, video_ids in jobs))
+
+    async def _backfill_expiry(self, object_ids):
+        """Store links_expire_at once on videos written before it existed"""
+        cursor = videos_collection.find(
+            {"_id": {"$in": object_ids}, "links_expire_at": {"$exists": False}},
+            {"download_urls": 1, "video_url": 1}
+        )
+        async for video in cursor:
+            await videos_collection.update_one(
+                {"_id": video["_id"]},
+                {"$set": {"links_expire_at": link_expiry(video)}}
+            )
+
+    async def _refresh(self, semaphore, url, video_ids):
+        """Re-resolve one share and store the fresh links"""
+        async with semaphore:
+            try:
+                video_info = await self.scraper.extract_video_info(url, force_refresh=True)
+                if not video_info or video_info.get("partial"):
+                    self.failed += 1
+                    return
+
+                for video_id in video_ids:
+                    await MongoVideo.update_links(video_id, video_info)
+                self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error refreshing links for {url}: {e}")
+
+    def stats(self):
+        """Get refresher counters"""
+        return {
+            "running": self._task is not None,
+            "cycles": self.cycles,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "last_run": self.last_run.isoformat() if self.last_run else None
+        }
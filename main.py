@@ -7,7 +7,7 @@ import asyncio
 import logging
 from threading import Thread
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
@@ -15,7 +15,12 @@ from pyrogram import Client
 from commands.start import StartCommand
 from commands.help import HelpCommand
 from commands.stream import StreamCommand
-from mongodb_config import init_mongodb
+from commands.history import HistoryCommand
+from mongodb_config import init_mongodb, MongoCounters, MongoDownload, download_buffer, videos_cache
+from link_refresher import LinkRefresher
+from features.download import cleanup_partial_downloads
+from utils import run_periodically
+from config_vars import LINK_REFRESH_ENABLED, STATS_RECONCILE_INTERVAL, ROLLUP_INTERVAL, DOWNLOAD_CLEANUP_INTERVAL
 
 # Configure logging
 logging.basicConfig(
@@ -49,6 +54,11 @@ bot = Client(
 start_handler = StartCommand(bot)
 help_handler = HelpCommand(bot)
 stream_handler = StreamCommand(bot)
+history_handler = HistoryCommand(bot)
+
+# Background jobs
+link_refresher = LinkRefresher(stream_handler.scraper)
+background_tasks = []
 
 @app.on_event("startup")
 async def startup_event():
@@ -59,6 +69,46 @@ async def startup_event():
     # Start bot in background
     asyncio.create_task(start_bot())
     logger.info("TeraBox Bot started")
+    
+    download_buffer.start()
+    
+    if LINK_REFRESH_ENABLED:
+        link_refresher.start()
+        logger.info("Link refresher started")
+    
+    # Fold raw download events into hourly buckets
+    background_tasks.append(asyncio.create_task(
+        run_periodically(MongoDownload.rollup_hourly, ROLLUP_INTERVAL)
+    ))
+    
+    # Correct drift in the /stats counters
+    background_tasks.append(asyncio.create_task(
+        run_periodically(MongoCounters.reconcile, STATS_RECONCILE_INTERVAL)
+    ))
+    
+    # Remove resume files of abandoned downloads
+    background_tasks.append(asyncio.create_task(
+        run_periodically(cleanup_partial_downloads, DOWNLOAD_CLEANUP_INTERVAL)
+    ))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release resources on shutdown"""
+    from page_parser import shutdown_parse_pool
+    from http_client import http_pool, media_pool
+    
+    await link_refresher.stop()
+    for task in background_tasks:
+        task.cancel()
+    await download_buffer.stop()
+    logger.info("Download records flushed")
+    await stream_handler.scraper.close()
+    await http_pool.close()
+    await media_pool.close()
+    logger.info("HTTP client pool closed")
+    
+    shutdown_parse_pool()
+    logger.info("Parse workers stopped")
 
 async def start_bot():
     """Start the Telegram bot"""
@@ -104,6 +154,56 @@ async def stream_video(video_id: str, request: Request):
         logger.error(f"Error streaming video {video_id}: {e}")
         return JSONResponse({"error": "Internal server error"}, status_code=500)
 
+@app.get("/media/{video_id}")
+async def media_video(video_id: str, request: Request):
+    """Relay the video file with byte-range support for seeking"""
+    from features.media import open_media, UpstreamError
+    
+    try:
+        media = await open_media(video_id, request.headers.get("range"), request.headers.get("if-range"))
+        if not media:
+            return JSONResponse({"error": "Video not found"}, status_code=404)
+        
+        status, headers, body = media
+        return StreamingResponse(body, status_code=status, headers=headers)
+    except UpstreamError as e:
+        logger.error(f"Upstream error relaying video {video_id}: {e}")
+        return JSONResponse({"error": "Video source unavailable"}, status_code=502)
+    except asyncio.TimeoutError:
+        # No free media connection (or upstream did not answer) within the connect timeout
+        logger.warning(f"Timed out opening video {video_id}")
+        return JSONResponse({"error": "Video source busy, please retry"}, status_code=503)
+    except Exception as e:
+        logger.error(f"Error relaying video {video_id}: {e}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+@app.get("/thumb/{video_id}")
+async def thumbnail(video_id: str, request: Request, w: int = None):
+    """Resized, cached thumbnail (WebP when the client accepts it, else JPEG)"""
+    from features.thumbnail import get_thumbnail, ThumbnailError
+    from config_vars import THUMB_CACHE_MAX_AGE
+    
+    try:
+        thumb = await get_thumbnail(video_id, w, request.headers.get("accept"))
+        if not thumb:
+            return JSONResponse({"error": "Thumbnail not found"}, status_code=404)
+        
+        data, media_type, etag = thumb
+        headers = {
+            "Cache-Control": f"public, max-age={THUMB_CACHE_MAX_AGE}, immutable",
+            "ETag": etag,
+            "Vary": "Accept"
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=data, media_type=media_type, headers=headers)
+    except ThumbnailError as e:
+        logger.error(f"Thumbnail error for video {video_id}: {e}")
+        return JSONResponse({"error": "Thumbnail unavailable"}, status_code=502)
+    except Exception as e:
+        logger.error(f"Error getting thumbnail {video_id}: {e}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
 @app.get("/api/video/{video_id}")
 async def get_video_info(video_id: str):
     """Get video information as JSON"""
@@ -119,6 +219,17 @@ async def get_video_info(video_id: str):
         logger.error(f"Error getting video info {video_id}: {e}")
         return JSONResponse({"error": "Internal server error"}, status_code=500)
 
+@app.get("/api/stats/videos")
+async def get_videos_stats(ids: str = None, top: int = None, hours: int = None):
+    """Get stream and download counts for a comma-separated list of IDs, or the top videos"""
+    from features.stream import get_batch_video_stats
+    
+    video_ids = [video_id for video_id in ids.split(",") if video_id][:500] if ids else None
+    if video_ids is None and not top:
+        return JSONResponse({"error": "Pass ids or top"}, status_code=400)
+    
+    return JSONResponse(await get_batch_video_stats(video_ids, top_k=min(top, 100) if top else None, hours=hours))
+
 @app.get("/download/{video_id}")
 async def download_video(video_id: str):
     """Download video redirect"""
@@ -137,18 +248,10 @@ async def download_video(video_id: str):
 @app.get("/stats")
 async def get_stats():
     """Get bot statistics"""
-    from mongodb_config import videos_sync, downloads_sync
+    from mongodb_config import MongoCounters
     
     try:
-        total_videos = videos_sync.count_documents({})
-        total_streams = downloads_sync.count_documents({"download_type": "stream"})
-        total_downloads = downloads_sync.count_documents({"download_type": "download"})
-        
-        return JSONResponse({
-            "total_videos": total_videos,
-            "total_streams": total_streams,
-            "total_downloads": total_downloads
-        })
+        return JSONResponse(await MongoCounters.get())
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return JSONResponse({
@@ -157,6 +260,43 @@ async def get_stats():
             "total_downloads": 0
         })
 
+@app.get("/metrics")
+async def get_metrics():
+    """Get internal performance counters"""
+    from terabox_scraper import (
+        resolution_cache, failure_cache, shared_stats, fetch_stats,
+        probe_stats, api_stats, api_wins, hedge_delay
+    )
+    from http_client import http_pool, media_pool
+    from host_control import host_stats
+    from strategies import strategy_registry
+    from features.media import media_stats, segment_cache
+    from features.upload import upload_stats, active_uploads, send_tasks
+    from features.thumbnail import thumb_cache
+    
+    return JSONResponse({
+        "http_pool": http_pool.stats(),
+        "media_pool": media_pool.stats(),
+        "hosts": host_stats(),
+        "strategies": strategy_registry.stats(),
+        "link_refresher": link_refresher.stats(),
+        "download_buffer": download_buffer.stats(),
+        "video_cache": videos_cache.stats(),
+        "media_proxy": media_stats,
+        "media_segments": segment_cache.stats() if segment_cache else None,
+        "uploads": {**upload_stats, "active": len(active_uploads), "pending_sends": len(send_tasks)},
+        "thumbnails": thumb_cache.stats(),
+        "resolution_cache": resolution_cache.stats(),
+        "failure_cache": failure_cache.stats(),
+        "shared_cache": shared_stats,
+        "page_fetch": fetch_stats,
+        "download_probes": {name: stats.snapshot() for name, stats in probe_stats.items()},
+        "api_endpoints": {
+            name: {**stats.snapshot(), "wins": api_wins[name], "hedge_delay": hedge_delay(name)}
+            for name, stats in api_stats.items()
+        }
+    })
+
 if __name__ == "__main__":
     # Run with uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,48 @@
+"""
+Rolling success and latency statistics for TeraBox Bot
+"""
+from collections import deque
+
+class RollingStats:
+    """Exponentially weighted success rate and latency for one operation
+
+    The last few latencies are also kept, for tail percentiles.
+    """
+
+    def __init__(self, alpha=0.2, prior_success=0.5, prior_latency=1.0, window=64):
+        self.alpha = alpha
+        self.attempts = 0
+        self.successes = 0
+        self.success_rate = prior_success
+        self.latency = prior_latency
+        self.recent = deque(maxlen=window)
+
+    def record(self, success, latency):
+        """Fold one outcome into the rolling averages"""
+        self.attempts += 1
+        if success:
+            self.successes += 1
+        self.success_rate += self.alpha * ((1.0 if success else 0.0) - self.success_rate)
+        self.latency += self.alpha * (latency - self.latency)
+        self.recent.append(latency)
+
+    def expected_cost(self):
+        """Expected seconds spent per success"""
+        return self.latency / max(self.success_rate, 0.01)
+
+    def latency_percentile(self, percentile):
+        """Latency at a percentile of the recent window (the mean if empty)"""
+        if not self.recent:
+            return self.latency
+        ordered = sorted(self.recent)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+    def snapshot(self):
+        """Get the current values as a dict"""
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "success_rate": round(self.success_rate, 4),
+            "latency": round(self.latency, 4),
+            "latency_p95": round(self.latency_percentile(95), 4)
+        }
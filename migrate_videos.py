@@ -0,0 +1,134 @@
+"""
+One-off migration: fold per-user video documents into canonical videos
+
+Every legacy ``videos`` document (one per submission, carrying ``user_id``)
+becomes a ``submissions`` record that keeps its original ``_id``, so the
+script can be re-run safely. Each share keeps a single canonical video with
+the freshest links, and ``downloads.video_id`` and the hourly download
+buckets are remapped to it.
+
+Usage: python migrate_videos.py [--dry-run]
+"""
+import sys
+import asyncio
+import logging
+from datetime import datetime
+from mongodb_config import sync_db, videos_sync, downloads_sync, MongoCounters
+from utils import extract_terabox_id
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+submissions_sync = sync_db.submissions
+downloads_hourly_sync = sync_db.downloads_hourly
+
+LINK_FIELDS = ("title", "file_size", "duration", "thumbnail_url", "video_url", "download_urls", "links_expire_at")
+
+def share_key(video):
+    """Canonical share ID for a video document"""
+    url = video.get("original_url") or ""
+    return video.get("share_id") or extract_terabox_id(url) or url
+
+def group_by_share():
+    """Group legacy and canonical video documents by share ID"""
+    groups = {}
+    for video in videos_sync.find({}):
+        key = share_key(video)
+        if key:
+            groups.setdefault(key, []).append(video)
+    return groups
+
+def migrate_share(share_id, videos, dry_run=False):
+    """Fold one share's documents into its canonical video"""
+    legacy = [v for v in videos if "user_id" in v]
+    if not legacy and len(videos) == 1:
+        return 0
+
+    # Keep an existing canonical document so its ID stays stable,
+    # otherwise promote the most recently updated legacy one
+    by_freshness = sorted(videos, key=lambda v: v.get("updated_at") or v.get("created_at") or datetime.min)
+    canonical = next((v for v in videos if "user_id" not in v and v.get("share_id")), by_freshness[-1])
+    freshest = by_freshness[-1]
+    canonical_id = str(canonical["_id"])
+    merged_ids = [v["_id"] for v in videos if v["_id"] != canonical["_id"]]
+
+    if dry_run:
+        logger.info(f"{share_id}: {len(videos)} documents -> {canonical_id}")
+        return len(merged_ids)
+
+    for video in legacy:
+        submissions_sync.update_one(
+            {"_id": video["_id"]},
+            {"$setOnInsert": {
+                "user_id": video["user_id"],
+                "video_id": canonical_id,
+                "share_id": share_id,
+                "original_url": video.get("original_url"),
+                "title": video.get("title", "Unknown Title"),
+                "status": video.get("status", "completed"),
+                "created_at": video.get("created_at") or datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    created_at = min(v.get("created_at") or datetime.utcnow() for v in videos)
+    videos_sync.update_one(
+        {"_id": canonical["_id"]},
+        {
+            "$set": {
+                **{field: freshest.get(field) for field in LINK_FIELDS if field in freshest},
+                "share_id": share_id,
+                "created_at": created_at,
+                "updated_at": datetime.utcnow()
+            },
+            "$unset": {"user_id": ""}
+        }
+    )
+
+    if merged_ids:
+        downloads_sync.update_many(
+            {"video_id": {"$in": [str(video_id) for video_id in merged_ids]}},
+            {"$set": {"video_id": canonical_id}}
+        )
+        submissions_sync.update_many(
+            {"video_id": {"$in": [str(video_id) for video_id in merged_ids]}},
+            {"$set": {"video_id": canonical_id}}
+        )
+        merge_buckets([str(video_id) for video_id in merged_ids], canonical_id)
+        videos_sync.delete_many({"_id": {"$in": merged_ids}})
+
+    return len(merged_ids)
+
+def merge_buckets(old_ids, canonical_id):
+    """Add the hourly download buckets of merged videos to the canonical video"""
+    for bucket in downloads_hourly_sync.find({"video_id": {"$in": old_ids}}):
+        key = {"video_id": canonical_id, "download_type": bucket["download_type"], "hour": bucket["hour"]}
+        downloads_hourly_sync.update_one(
+            {"_id": key},
+            {"$inc": {"count": bucket["count"]}, "$set": key},
+            upsert=True
+        )
+        downloads_hourly_sync.delete_one({"_id": bucket["_id"]})
+
+def main():
+    """Run the migration"""
+    dry_run = "--dry-run" in sys.argv[1:]
+    groups = group_by_share()
+    logger.info(f"Found {sum(len(v) for v in groups.values())} videos across {len(groups)} shares")
+
+    merged = 0
+    for share_id, videos in groups.items():
+        try:
+            merged += migrate_share(share_id, videos, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Error migrating share {share_id}: {e}")
+
+    logger.info(f"{'Would merge' if dry_run else 'Merged'} {merged} duplicate videos")
+    if not dry_run:
+        logger.info(f"Counters reset: {asyncio.run(MongoCounters.reconcile())}")
+
+if __name__ == "__main__":
+    main()
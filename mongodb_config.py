@@ -4,8 +4,16 @@ MongoDB configuration for TeraBox Bot
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
-from datetime import datetime
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from datetime import datetime, timedelta
 import logging
+from cache import TTLCache
+from event_buffer import EventBuffer
+from config_vars import (
+    STATS_CACHE_TTL, VIDEO_CACHE_TTL, VIDEO_CACHE_SIZE, DOWNLOAD_BUFFER_BATCH, DOWNLOAD_BUFFER_INTERVAL,
+    DOWNLOAD_BUFFER_MAX, DOWNLOAD_BUFFER_POLICY, DOWNLOADS_RETENTION_DAYS,
+    ROLLUP_LAG, ROLLUP_MAX_HOURS
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +33,10 @@ users_collection = async_db.users
 videos_collection = async_db.videos
 downloads_collection = async_db.downloads
 settings_collection = async_db.settings
+resolutions_collection = async_db.resolutions
+submissions_collection = async_db.submissions
+downloads_hourly_collection = async_db.downloads_hourly
+counters_collection = async_db.counters
 
 # Sync collections for web server
 users_sync = sync_db.users
@@ -52,26 +64,126 @@ class MongoUser:
         """Count total users (sync)"""
         return users_sync.count_documents({})
 
+# Read-through cache for video lookups by ID, shared by bot callbacks and web routes
+videos_cache = TTLCache(maxsize=VIDEO_CACHE_SIZE, ttl=VIDEO_CACHE_TTL, name="videos")
+
+# Titles a resolution falls back to when it found no real one
+PLACEHOLDER_TITLES = {"TeraBox Video", "Unknown", "Unknown Title"}
+
+# Fields of a new video document that no resolution has filled yet
+VIDEO_DEFAULTS = {
+    "title": "Unknown Title",
+    "file_size": 0,
+    "duration": 0,
+    "thumbnail_url": None,
+    "video_url": None,
+    "download_urls": [],
+    "links_expire_at": None
+}
+
 class MongoVideo:
+    """Canonical video documents, one per share ID"""
+    
     @staticmethod
-    async def create(video_data):
-        """Create new video record"""
-        video_data["created_at"] = datetime.utcnow()
-        video_data["updated_at"] = datetime.utcnow()
-        result = await videos_collection.insert_one(video_data)
-        return str(result.inserted_id)
+    async def upsert_by_share(share_id, original_url, video_info):
+        """Create or refresh the canonical video for a share
+
+        Only fields the new result actually has are written. A partial result
+        only fills a new document: its metadata never replaces a stored
+        value, and its links only replace stored links that are missing or
+        expired. Returns (video_id, created).
+        """
+        from utils import link_expiry
+        now = datetime.utcnow()
+        partial = bool(video_info.get("partial"))
+        metadata = {
+            key: video_info[key] for key in ("title", "file_size", "duration", "thumbnail_url")
+            if video_info.get(key)
+        }
+        if metadata.get("title") in PLACEHOLDER_TITLES:
+            del metadata["title"]
+        
+        links = {}
+        if video_info.get("download_urls") or video_info.get("video_url"):
+            # Links are written together so they always share one expiry
+            links = {
+                "video_url": video_info.get("video_url"),
+                "download_urls": video_info.get("download_urls") or [],
+                "links_expire_at": link_expiry(video_info)
+            }
+        
+        to_set = {} if partial else {**metadata, **links}
+        on_insert = {**VIDEO_DEFAULTS, **metadata, **links} if partial else dict(VIDEO_DEFAULTS)
+        on_insert = {key: value for key, value in on_insert.items() if key not in to_set}
+        update = {
+            "$set": {**to_set, "status": "completed", "updated_at": now},
+            "$setOnInsert": {**on_insert, "share_id": share_id, "original_url": original_url, "created_at": now}
+        }
+        
+        try:
+            result = await videos_collection.update_one({"share_id": share_id}, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost an insert race on the unique index; the document exists now
+            result = await videos_collection.update_one({"share_id": share_id}, update, upsert=True)
+        
+        if partial and links and result.upserted_id is None:
+            # A partial link still beats none, or an expired one
+            await videos_collection.update_one(
+                {"share_id": share_id, "$or": [
+                    {"links_expire_at": {"$lte": now}},
+                    {"video_url": None, "download_urls": {"$in": [[], None]}}
+                ]},
+                {"$set": links}
+            )
+        
+        if result.upserted_id is not None:
+            await MongoCounters.increment(total_videos=1)
+            return str(result.upserted_id), True
+        
+        video = await videos_collection.find_one({"share_id": share_id}, {"_id": 1})
+        videos_cache.invalidate(str(video["_id"]))
+        return str(video["_id"]), False
     
     @staticmethod
     async def find_by_id(video_id):
-        """Find video by ID"""
+        """Find video by ID, served from the videos cache when fresh"""
         from bson import ObjectId
-        return await videos_collection.find_one({"_id": ObjectId(video_id)})
+        object_id = ObjectId(video_id)
+        video = await videos_cache.get_or_load(
+            str(object_id),
+            lambda: videos_collection.find_one({"_id": object_id})
+        )
+        # Callers get their own copy so they cannot alter the cached document
+        return dict(video) if video else None
     
     @staticmethod
-    async def find_by_user(user_id, limit=10):
-        """Find videos by user ID"""
-        cursor = videos_collection.find({"user_id": user_id}).sort("created_at", -1).limit(limit)
-        return await cursor.to_list(length=limit)
+    async def update_links(video_id, video_info):
+        """Replace a video's direct links after a re-resolution"""
+        from bson import ObjectId
+        from utils import link_expiry
+        now = datetime.utcnow()
+        object_id = ObjectId(video_id)
+        await videos_collection.update_one(
+            {"_id": object_id},
+            {"$set": {
+                "download_urls": video_info.get("download_urls", []),
+                "video_url": video_info.get("video_url"),
+                "links_expire_at": link_expiry(video_info),
+                "links_refreshed_at": now,
+                "updated_at": now
+            }}
+        )
+        videos_cache.invalidate(str(object_id))
+    
+    @staticmethod
+    async def set_file_id(video_id, file_id):
+        """Remember the Telegram file_id of an uploaded video for instant re-sends"""
+        from bson import ObjectId
+        await videos_collection.update_one(
+            {"_id": ObjectId(video_id)},
+            {"$set": {"telegram_file_id": file_id, "updated_at": datetime.utcnow()}}
+        )
+        videos_cache.invalidate(str(ObjectId(video_id)))
     
     @staticmethod
     def count():
@@ -84,12 +196,261 @@ class MongoVideo:
         from bson import ObjectId
         return videos_sync.find_one({"_id": ObjectId(video_id)})
 
+class MongoSubmission:
+    """Per-user record of a submitted link, pointing at the canonical video"""
+    
+    @staticmethod
+    async def create(submission_data):
+        """Create submission record"""
+        submission_data["created_at"] = datetime.utcnow()
+        result = await submissions_collection.insert_one(submission_data)
+        return str(result.inserted_id)
+    
+    # Fields needed to render a history entry
+    HISTORY_PROJECTION = {"title": 1, "status": 1, "created_at": 1}
+    
+    @staticmethod
+    async def find_page(user_id, limit=10, before=None, after=None):
+        """Find one page of a user's submissions, newest first
+
+        ``before`` and ``after`` are (created_at, _id) keys of the last or
+        first entry of the neighbouring page; the (user_id, created_at, _id)
+        index serves both directions. One extra entry is fetched, so the
+        result tells whether the page continues in that direction.
+        Returns (submissions, has_more).
+        """
+        query = {"user_id": user_id}
+        direction = -1
+        key = before
+        if after is not None:
+            direction = 1
+            key = after
+        
+        if key is not None:
+            created_at, object_id = key
+            op = "$lt" if direction == -1 else "$gt"
+            query["$or"] = [
+                {"created_at": {op: created_at}},
+                {"created_at": created_at, "_id": {op: object_id}}
+            ]
+        
+        cursor = submissions_collection.find(query, MongoSubmission.HISTORY_PROJECTION).sort(
+            [("created_at", direction), ("_id", direction)]
+        ).limit(limit + 1)
+        submissions = await cursor.to_list(length=limit + 1)
+        
+        has_more = len(submissions) > limit
+        submissions = submissions[:limit]
+        if direction == 1:
+            submissions.reverse()
+        return submissions, has_more
+    
+    @staticmethod
+    async def has_access(user_id, video_id):
+        """Check if a user has submitted the share behind a video"""
+        submission = await submissions_collection.find_one(
+            {"user_id": user_id, "video_id": video_id},
+            {"_id": 1}
+        )
+        return submission is not None
+
 class MongoDownload:
     @staticmethod
     async def create(download_data):
-        """Create download record"""
+        """Queue a download record; it is written in the next batch"""
         download_data["created_at"] = datetime.utcnow()
-        await downloads_collection.insert_one(download_data)
+        await download_buffer.put(download_data)
+    
+    @staticmethod
+    async def write_batch(batch):
+        """Insert a batch of download records and bump the counters once"""
+        written = batch
+        try:
+            await downloads_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys come from a retried batch that partly made it in
+            # before; those records were never counted, so count them now
+            failed = {
+                error["index"] for error in e.details.get("writeErrors", [])
+                if error.get("code") != 11000
+            }
+            written = [doc for i, doc in enumerate(batch) if i not in failed]
+            if failed:
+                logger.error(f"Failed to write {len(failed)} of {len(batch)} download records")
+        
+        totals = {}
+        for download_data in written:
+            counter = COUNTER_FIELDS.get(download_data.get("download_type"))
+            if counter:
+                totals[counter] = totals.get(counter, 0) + 1
+        if totals:
+            await MongoCounters.increment(**totals)
+    
+    @staticmethod
+    async def rollup_watermark():
+        """Start of the first hour not yet folded into hourly buckets, or None"""
+        return await rollup_cache.get_or_load(ROLLUP_WATERMARK_ID, MongoDownload._load_watermark)
+    
+    @staticmethod
+    async def _load_watermark():
+        """Read the rollup watermark from settings"""
+        doc = await settings_collection.find_one({"_id": ROLLUP_WATERMARK_ID})
+        return doc.get("rolled_up_to") if doc else None
+    
+    @staticmethod
+    async def rollup_hourly():
+        """Fold closed hours of raw events into per-video, per-type hourly buckets
+
+        Whole hours are re-aggregated and replace their buckets, so a rerun
+        or a concurrent run on another replica gives the same result. Hours
+        are closed ROLLUP_LAG seconds after they end so buffered writes land
+        first. Returns the new watermark.
+        """
+        rollup_cache.invalidate(ROLLUP_WATERMARK_ID)
+        start = await MongoDownload.rollup_watermark()
+        if start is None:
+            # First run: start at the oldest raw event
+            oldest = await downloads_collection.find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+            if not oldest:
+                return None
+            start = hour_start(oldest["created_at"])
+        
+        end = hour_start(datetime.utcnow() - timedelta(seconds=ROLLUP_LAG))
+        end = min(end, start + timedelta(hours=ROLLUP_MAX_HOURS))
+        if end <= start:
+            return start
+        
+        pipeline = [
+            {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {
+                    "video_id": "$video_id",
+                    "download_type": "$download_type",
+                    "hour": {"$dateFromParts": {
+                        "year": {"$year": "$created_at"},
+                        "month": {"$month": "$created_at"},
+                        "day": {"$dayOfMonth": "$created_at"},
+                        "hour": {"$hour": "$created_at"}
+                    }}
+                },
+                "count": {"$sum": 1}
+            }},
+            {"$set": {
+                "video_id": "$_id.video_id",
+                "download_type": "$_id.download_type",
+                "hour": "$_id.hour"
+            }},
+            {"$merge": {
+                "into": downloads_hourly_collection.name,
+                "on": "_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        await downloads_collection.aggregate(pipeline).to_list(length=None)
+        
+        await settings_collection.update_one(
+            {"_id": ROLLUP_WATERMARK_ID},
+            {"$max": {"rolled_up_to": end}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        rollup_cache.invalidate(ROLLUP_WATERMARK_ID)
+        logger.info(f"Rolled up download events from {start} to {end}")
+        
+        await MongoDownload.expire_rolled_up(end)
+        return end
+    
+    @staticmethod
+    async def expire_rolled_up(watermark):
+        """Delete raw events past the retention period that are already in buckets
+
+        Events at or after the watermark are kept whatever their age, so a
+        rollup that falls behind never loses counts.
+        """
+        cutoff = min(watermark, datetime.utcnow() - timedelta(days=DOWNLOADS_RETENTION_DAYS))
+        result = await downloads_collection.delete_many({"created_at": {"$lt": cutoff}})
+        if result.deleted_count:
+            logger.info(f"Expired {result.deleted_count} download events before {cutoff}")
+        return result.deleted_count
+    
+    @staticmethod
+    async def aggregate_counts(group, video_ids=None, since=None, tail=()):
+        """Run a $group over event counts in one aggregation
+
+        Hours before the rollup watermark come from the hourly buckets and
+        later events from the raw collection, so the cost follows the time
+        range rather than the event volume. ``since`` has hour granularity
+        for bucketed hours. Every input document has video_id,
+        download_type and count.
+        """
+        watermark = await MongoDownload.rollup_watermark()
+        
+        raw_match = {"download_type": {"$in": list(COUNTER_FIELDS)}}
+        if video_ids is not None:
+            raw_match["video_id"] = {"$in": list(video_ids)}
+        bucket_match = dict(raw_match)
+        
+        raw_since = since
+        if watermark is not None:
+            raw_since = max(since, watermark) if since is not None else watermark
+            bucket_match["hour"] = {"$lt": watermark}
+            if since is not None:
+                bucket_match["hour"]["$gte"] = hour_start(since)
+        if raw_since is not None:
+            raw_match["created_at"] = {"$gte": raw_since}
+        
+        raw = [
+            {"$match": raw_match},
+            # Only indexed fields, so the raw tail is covered
+            {"$project": {"_id": 0, "video_id": 1, "download_type": 1, "count": {"$literal": 1}}}
+        ]
+        if watermark is None:
+            collection, pipeline = downloads_collection, raw
+        else:
+            collection = downloads_hourly_collection
+            pipeline = [
+                {"$match": bucket_match},
+                {"$project": {"_id": 0, "video_id": 1, "download_type": 1, "count": 1}},
+                {"$unionWith": {"coll": downloads_collection.name, "pipeline": raw}}
+            ]
+        
+        pipeline = pipeline + [{"$group": group}, *tail]
+        return await collection.aggregate(pipeline).to_list(length=None)
+    
+    @staticmethod
+    async def batch_stats(video_ids=None, since=None, top_k=None):
+        """Stream and download counts for many videos in one aggregation
+
+        Counts the given video IDs, or with ``top_k`` the most accessed
+        videos, optionally only since a point in time. Returns a dict of
+        video ID -> {"total_streams": n, "total_downloads": n}, ordered by
+        popularity when ``top_k`` is set.
+        """
+        group = {
+            "_id": "$video_id",
+            **{
+                counter: {"$sum": {"$cond": [{"$eq": ["$download_type", download_type]}, "$count", 0]}}
+                for download_type, counter in COUNTER_FIELDS.items()
+            },
+            "total": {"$sum": "$count"}
+        }
+        tail = [{"$sort": {"total": -1}}, {"$limit": top_k}] if top_k is not None else []
+        docs = await MongoDownload.aggregate_counts(group, video_ids=video_ids, since=since, tail=tail)
+        
+        stats = {}
+        if top_k is None:
+            # Videos with no events still get zero counts
+            stats = {video_id: {counter: 0 for counter in COUNTER_FIELDS.values()} for video_id in video_ids or []}
+        for doc in docs:
+            stats[doc["_id"]] = {counter: doc[counter] for counter in COUNTER_FIELDS.values()}
+        return stats
+    
+    @staticmethod
+    async def totals_by_type():
+        """All-time counter totals per download type"""
+        docs = await MongoDownload.aggregate_counts({"_id": "$download_type", "count": {"$sum": "$count"}})
+        counts = {doc["_id"]: doc["count"] for doc in docs}
+        return {counter: counts.get(download_type, 0) for download_type, counter in COUNTER_FIELDS.items()}
     
     @staticmethod
     def count():
@@ -101,15 +462,193 @@ class MongoDownload:
         """Count downloads by type (sync)"""
         return downloads_sync.count_documents({"download_type": download_type})
 
+# Counter field kept for each download type
+COUNTER_FIELDS = {"stream": "total_streams", "download": "total_downloads"}
+
+# Settings document holding the hourly rollup watermark, and a short cache of it
+ROLLUP_WATERMARK_ID = "downloads_rollup"
+rollup_cache = TTLCache(maxsize=1, ttl=60, name="rollup")
+
+def hour_start(moment):
+    """Truncate a datetime to the start of its hour"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+# Write-behind buffer for download records
+download_buffer = EventBuffer(
+    MongoDownload.write_batch,
+    max_batch=DOWNLOAD_BUFFER_BATCH,
+    flush_interval=DOWNLOAD_BUFFER_INTERVAL,
+    max_pending=DOWNLOAD_BUFFER_MAX,
+    policy=DOWNLOAD_BUFFER_POLICY,
+    name="downloads"
+)
+
+# Short-lived cache in front of the counters document
+counters_cache = TTLCache(maxsize=1, ttl=STATS_CACHE_TTL, name="stats")
+
+class MongoCounters:
+    """Materialized totals for /stats, kept current with $inc"""
+    
+    GLOBAL_ID = "global"
+    
+    @staticmethod
+    async def increment(**fields):
+        """Increment one or more counters"""
+        await counters_collection.update_one(
+            {"_id": MongoCounters.GLOBAL_ID},
+            {"$inc": fields, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+    
+    @staticmethod
+    async def _load():
+        """Read the counters document"""
+        doc = await counters_collection.find_one({"_id": MongoCounters.GLOBAL_ID}) or {}
+        return {
+            "total_videos": doc.get("total_videos", 0),
+            "total_streams": doc.get("total_streams", 0),
+            "total_downloads": doc.get("total_downloads", 0)
+        }
+    
+    @staticmethod
+    async def get():
+        """Get the totals, cached for STATS_CACHE_TTL seconds"""
+        return await counters_cache.get_or_load(MongoCounters.GLOBAL_ID, MongoCounters._load)
+    
+    @staticmethod
+    async def reconcile():
+        """Recount from the collections and hourly buckets to correct any drift"""
+        totals = {
+            "total_videos": await videos_collection.count_documents({}),
+            **await MongoDownload.totals_by_type()
+        }
+        
+        await counters_collection.update_one(
+            {"_id": MongoCounters.GLOBAL_ID},
+            {"$set": {**totals, "updated_at": datetime.utcnow(), "reconciled_at": datetime.utcnow()}},
+            upsert=True
+        )
+        counters_cache.invalidate(MongoCounters.GLOBAL_ID)
+        logger.info(f"Counters reconciled: {totals}")
+        return totals
+
+class MongoResolution:
+    """Shared resolution cache keyed by canonical share ID
+
+    Documents are ``resolving`` (a node holds a lease and is scraping),
+    ``resolved`` (``data`` holds the video info) or ``failed`` (kept briefly
+    so nodes waiting on a dead share give up too). ``expires_at`` drives a
+    TTL index so entries vanish when their links expire.
+    """
+    
+    @staticmethod
+    async def find_resolved(share_id):
+        """Get fresh resolved video info for a share, or None"""
+        doc = await resolutions_collection.find_one({
+            "_id": share_id,
+            "status": "resolved",
+            "expires_at": {"$gt": datetime.utcnow()}
+        })
+        return doc["data"] if doc else None
+    
+    @staticmethod
+    async def find_state(share_id):
+        """Get the shared cache document for a share, or None"""
+        return await resolutions_collection.find_one({"_id": share_id})
+    
+    @staticmethod
+    async def claim(share_id, owner, lease_seconds):
+        """Try to become the only node resolving a share (compare-and-set)"""
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=lease_seconds)
+        try:
+            await resolutions_collection.update_one(
+                {
+                    "_id": share_id,
+                    "$or": [
+                        {"status": {"$ne": "resolving"}},
+                        {"lease_until": {"$lt": now}}
+                    ]
+                },
+                {"$set": {
+                    "status": "resolving",
+                    "owner": owner,
+                    "lease_until": lease_until,
+                    "expires_at": lease_until,
+                    "updated_at": now
+                }},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Filter missed an existing document: another node holds the lease
+            return False
+    
+    @staticmethod
+    async def store(share_id, owner, data, expires_at):
+        """Publish resolved video info for every node"""
+        await resolutions_collection.update_one(
+            {"_id": share_id},
+            {
+                "$set": {
+                    "status": "resolved",
+                    "owner": owner,
+                    "data": data,
+                    "expires_at": expires_at,
+                    "updated_at": datetime.utcnow()
+                },
+                "$unset": {"lease_until": ""}
+            },
+            upsert=True
+        )
+    
+    @staticmethod
+    async def mark_failed(share_id, owner, ttl):
+        """Record that our resolution failed, so nodes waiting on us stop"""
+        now = datetime.utcnow()
+        await resolutions_collection.update_one(
+            {"_id": share_id, "owner": owner, "status": "resolving"},
+            {
+                "$set": {"status": "failed", "expires_at": now + timedelta(seconds=ttl), "updated_at": now},
+                "$unset": {"lease_until": ""}
+            }
+        )
+    
+    @staticmethod
+    async def release(share_id, owner):
+        """Drop our lease without a result, so a waiting node can take over"""
+        await resolutions_collection.delete_one({"_id": share_id, "owner": owner, "status": "resolving"})
+
+async def drop_downloads_ttl():
+    """Remove the TTL index on raw download events if an earlier version made one
+
+    A TTL index deletes events before they are rolled up; expiry is done by
+    MongoDownload.expire_rolled_up instead.
+    """
+    indexes = await downloads_collection.index_information()
+    if "expireAfterSeconds" in indexes.get("created_at_1", {}):
+        await downloads_collection.drop_index("created_at_1")
+        logger.info("Dropped TTL index on download events")
+
 async def init_mongodb():
     """Initialize MongoDB indexes"""
     try:
         # Create indexes
         await users_collection.create_index("telegram_id", unique=True)
-        await videos_collection.create_index("user_id")
+        await videos_collection.create_index(
+            "share_id", unique=True,
+            partialFilterExpression={"share_id": {"$type": "string"}}
+        )
         await videos_collection.create_index("created_at")
+        await submissions_collection.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+        await submissions_collection.create_index([("user_id", 1), ("video_id", 1)])
         await downloads_collection.create_index("user_id")
-        await downloads_collection.create_index("video_id")
+        await downloads_collection.create_index([("created_at", 1), ("video_id", 1), ("download_type", 1)])
+        await downloads_collection.create_index([("video_id", 1), ("download_type", 1), ("created_at", 1)])
+        await downloads_hourly_collection.create_index([("video_id", 1), ("download_type", 1), ("hour", 1)])
+        await downloads_hourly_collection.create_index([("hour", 1), ("video_id", 1), ("download_type", 1)])
+        await drop_downloads_ttl()
+        await resolutions_collection.create_index("expires_at", expireAfterSeconds=0)
         
         logger.info("MongoDB initialized successfully")
     except Exception as e:
@@ -0,0 +1,350 @@
+"""
+Page parsing stage for TeraBox share pages
+
+Everything in this module is plain, picklable functions so that the parse
+stage can run in a worker process and hand a dict back to the event loop.
+"""
+import re
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, parse_qs, unquote
+from bs4 import BeautifulSoup
+from config_vars import PARSE_WORKERS, HTML_PARSER
+
+logger = logging.getLogger(__name__)
+
+# One alternation per script body. Keyed values are matched first; bare URLs
+# use a lookahead for the closing quote so that a following key is not consumed.
+SCRIPT_PATTERN = re.compile(
+    r'"(?P<key>download_url|dlink|video_url|stream_url|playUrl)":\s*"(?P<value>[^"]+)"'
+    r'|"(?P<url>https?://[^"]*)(?=")'
+)
+
+DOWNLOAD_KEYS = ('download_url', 'dlink')
+VIDEO_KEYS = ('video_url', 'stream_url', 'playUrl')  # in priority order
+
+SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(MB|GB|KB)', re.IGNORECASE)
+DURATION_HMS_PATTERN = re.compile(r'(\d+):(\d+):(\d+)')
+DURATION_MS_PATTERN = re.compile(r'(\d+):(\d+)')
+
+SIZE_MULTIPLIERS = {'KB': 1024, 'MB': 1024**2, 'GB': 1024**3}
+
+def _is_download_like(value):
+    """Check if a quoted value is a direct media or download URL"""
+    return value.startswith(('http://', 'https://')) and ('.mp4' in value or 'download' in value)
+
+def scan_scripts(scripts):
+    """Scan script bodies once for download URLs, dlink and the streaming URL"""
+    download_urls = {}
+    dlink = None
+    video_url = None
+
+    for script in scripts:
+        if not script:
+            continue
+
+        found_video = {}
+        for match in SCRIPT_PATTERN.finditer(script):
+            key = match.group('key')
+            if key is None:
+                value = match.group('url')
+                if _is_download_like(value):
+                    download_urls[value] = None
+                continue
+
+            value = match.group('value')
+            if key in DOWNLOAD_KEYS:
+                download_urls[value] = None
+                if key == 'dlink' and dlink is None:
+                    dlink = value
+            else:
+                found_video.setdefault(key, value)
+                # The keyed match consumed the value, so check it as a bare URL too
+                if _is_download_like(value):
+                    download_urls[value] = None
+
+        # First script with any streaming key wins, by key priority
+        if video_url is None and found_video:
+            video_url = next(found_video[key] for key in VIDEO_KEYS if key in found_video)
+
+    return {
+        'download_urls': list(download_urls),
+        'dlink': dlink,
+        'video_url': video_url
+    }
+
+def scan_text(text):
+    """Scan visible page text for file size and duration"""
+    info = {}
+
+    match = SIZE_PATTERN.search(text)
+    if match:
+        size_value = float(match.group(1))
+        size_unit = match.group(2).upper()
+        info['file_size'] = int(size_value * SIZE_MULTIPLIERS.get(size_unit, 1))
+
+    match = DURATION_HMS_PATTERN.search(text)
+    if match:
+        hours, minutes, seconds = map(int, match.groups())
+        info['duration'] = hours * 3600 + minutes * 60 + seconds
+    else:
+        match = DURATION_MS_PATTERN.search(text)
+        if match:
+            minutes, seconds = map(int, match.groups())
+            info['duration'] = minutes * 60 + seconds
+
+    return info
+
+def scan_page(scripts, text):
+    """Run the script and text scanners and merge their results"""
+    result = scan_scripts(scripts)
+    result.update(scan_text(text))
+    return result
+
+# Byte-level markers used to stop a streaming fetch early
+LINK_FIELD_MARKER = re.compile(rb'"(?:dlink|download_url|video_url|stream_url|playUrl)":\s*"[^"]+"')
+TITLE_END_MARKER = re.compile(rb'</title\s*>', re.IGNORECASE)
+SCRIPT_END_MARKER = re.compile(rb'</script\s*>', re.IGNORECASE)
+
+class EarlyFieldScanner:
+    """Watch a page as it downloads for the fields parse_page needs
+
+    The page is complete enough once the title has closed and a script holding
+    a link field has closed, so the rest of the body can be skipped.
+    """
+
+    OVERLAP = 8192  # re-scan this much so markers split across chunks are found
+
+    def __init__(self):
+        self.scanned = 0
+        self.title_seen = False
+        self.link_end = None
+        self.script_closed = False
+
+    def feed(self, buffer):
+        """Scan newly appended bytes; return True once the fields are present"""
+        start = max(self.scanned - self.OVERLAP, 0)
+        self.scanned = len(buffer)
+
+        if not self.title_seen and TITLE_END_MARKER.search(buffer, start):
+            self.title_seen = True
+
+        if self.link_end is None:
+            match = LINK_FIELD_MARKER.search(buffer, start)
+            if match:
+                self.link_end = match.end()
+
+        if self.link_end is not None and not self.script_closed:
+            self.script_closed = SCRIPT_END_MARKER.search(buffer, max(start, self.link_end)) is not None
+
+        return self.title_seen and self.script_closed
+
+def _select_parser(preferred):
+    """Pick the fastest available BeautifulSoup tree builder"""
+    if preferred != 'auto':
+        return preferred
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+PARSER_BACKEND = _select_parser(HTML_PARSER)
+
+def _absolute(src):
+    """Make a TeraBox relative path absolute"""
+    return src if src.startswith('http') else f"https://www.terabox.com{src}"
+
+def _find_title(soup, url):
+    """Find video title"""
+    title_selectors = [
+        'title',
+        '.file-name',
+        '.filename',
+        'h1',
+        '.video-title',
+        '[data-title]'
+    ]
+    
+    title = None
+    for selector in title_selectors:
+        element = soup.select_one(selector)
+        if element:
+            title = element.get_text(strip=True) or element.get('data-title')
+            if title and len(title) > 5:  # Basic validation
+                break
+    
+    if not title:
+        # Try to extract from URL or meta tags
+        title = _extract_title_from_meta(soup) or title_from_url(url)
+    
+    return title or 'Unknown Video'
+
+def _find_link_urls(soup):
+    """Find direct download links in anchors and buttons"""
+    download_urls = {}
+    
+    download_selectors = [
+        'a[href*="download"]',
+        'a[href*="dl."]',
+        'a[data-url]',
+        '.download-btn',
+        '.btn-download',
+        'a[href*=".mp4"]',
+        'a[href*=".mkv"]',
+        'a[href*=".avi"]'
+    ]
+    
+    for selector in download_selectors:
+        for element in soup.select(selector):
+            href = element.get('href') or element.get('data-url')
+            if href:
+                if href.startswith('/'):
+                    href = f"https://www.terabox.com{href}"
+                elif not href.startswith('http'):
+                    continue
+                download_urls[href] = None
+    
+    return download_urls
+
+def _find_media_url(soup):
+    """Find streaming URL in video and source tags"""
+    video_element = soup.find('video')
+    if video_element:
+        src = video_element.get('src')
+        if src:
+            return _absolute(src)
+    
+    for source in soup.find_all('source'):
+        src = source.get('src')
+        if src and any(ext in src for ext in ['.mp4', '.webm', '.ogg']):
+            return _absolute(src)
+    
+    return None
+
+def _find_thumbnail(soup):
+    """Find video thumbnail"""
+    img_selectors = [
+        'img[src*="thumb"]',
+        'img[src*="preview"]',
+        'img[data-src*="thumb"]',
+        '.thumbnail img',
+        '.preview img'
+    ]
+    
+    for selector in img_selectors:
+        img = soup.select_one(selector)
+        if img:
+            src = img.get('src') or img.get('data-src')
+            if src:
+                return _absolute(src)
+    
+    meta_image = soup.find('meta', property='og:image')
+    if meta_image:
+        return meta_image.get('content')
+    
+    return None
+
+def _extract_title_from_meta(soup):
+    """Extract title from meta tags"""
+    meta_title = soup.find('meta', property='og:title')
+    if meta_title:
+        return meta_title.get('content')
+    
+    meta_title = soup.find('meta', attrs={'name': 'title'})
+    if meta_title:
+        return meta_title.get('content')
+    
+    return None
+
+def title_from_url(url):
+    """Extract title from URL"""
+    try:
+        parsed = urlparse(url)
+        path_parts = parsed.path.split('/')
+        
+        # Look for filename in path
+        for part in reversed(path_parts):
+            if part and '.' in part:
+                # Remove file extension
+                return part.rsplit('.', 1)[0].replace('_', ' ').replace('-', ' ')
+        
+        # Look in query parameters
+        query_params = parse_qs(parsed.query)
+        for key in ['filename', 'title', 'name']:
+            if key in query_params:
+                return unquote(query_params[key][0])
+        
+    except:
+        pass
+    
+    return "TeraBox Video"
+
+def parse_page(html, url, encoding=None):
+    """Parse a share page and return the extracted fields as a plain dict"""
+    soup = BeautifulSoup(html, PARSER_BACKEND, from_encoding=encoding)
+    
+    scripts = [script.string for script in soup.find_all('script') if script.string]
+    page_data = scan_page(scripts, soup.get_text())
+    
+    download_urls = _find_link_urls(soup)
+    for match in page_data['download_urls']:
+        download_urls[match] = None
+    
+    result = {
+        'title': _find_title(soup, url),
+        'download_urls': list(download_urls),
+        'dlink': page_data['dlink'],
+        'video_url': _find_media_url(soup) or page_data['video_url'],
+        'thumbnail_url': _find_thumbnail(soup)
+    }
+    for key in ('file_size', 'duration'):
+        if key in page_data:
+            result[key] = page_data[key]
+    
+    return result
+
+_parse_pool = None
+
+def pool_context():
+    """Start method for parse workers
+
+    The server already runs Mongo monitor and resolver threads, and forking
+    a threaded process can leave a child stuck on a lock held at fork time.
+    Workers come from a fork server instead (spawn where there is none).
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["page_parser"])
+    return context
+
+def get_parse_pool():
+    """Get or create the parse worker pool, or None when parsing in threads"""
+    global _parse_pool
+    if PARSE_WORKERS <= 0:
+        return None
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=pool_context())
+    return _parse_pool
+
+async def parse_html(html, url, encoding=None):
+    """Run parse_page off the event loop"""
+    global _parse_pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_parse_pool(), parse_page, html, url, encoding)
+    except BrokenProcessPool:
+        logger.error("Parse worker pool broke, recreating it and parsing in a thread")
+        _parse_pool = None
+        return await loop.run_in_executor(None, parse_page, html, url, encoding)
+
+def shutdown_parse_pool():
+    """Stop the parse worker processes"""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
@@ -0,0 +1,318 @@
+"""
+Multi-connection segmented downloader for TeraBox Bot
+
+A file is split into fixed-size segments fetched with concurrent range
+requests and written in place into a preallocated ``.part`` file. Finished
+segments are recorded in a bitmap persisted next to it, so an interrupted
+download resumes where it stopped.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from http_client import media_pool, DEFAULT_HEADERS
+from config_vars import (
+    DOWNLOAD_CONNECTIONS, DOWNLOAD_SEGMENT_SIZE, DOWNLOAD_RETRIES,
+    MEDIA_CHUNK_SIZE, MEDIA_CONNECT_TIMEOUT, MEDIA_READ_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Ranges only make sense on the raw bytes, so never ask for compression
+DOWNLOAD_HEADERS = {**DEFAULT_HEADERS, "Accept-Encoding": "identity"}
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, connect=MEDIA_CONNECT_TIMEOUT, sock_connect=MEDIA_CONNECT_TIMEOUT, sock_read=MEDIA_READ_TIMEOUT
+)
+CONTENT_RANGE_PATTERN = re.compile(r'bytes \d+-\d+/(\d+)')
+
+# Upstream answers that mean the link itself has expired
+EXPIRED_STATUSES = (403, 404, 410)
+
+class DownloadError(Exception):
+    """The file could not be downloaded completely"""
+
+class SegmentedDownload:
+    """Download one URL into a file with N concurrent range requests
+
+    ``progress`` is called as ``progress(done_bytes, total_bytes, bytes_per_second)``
+    at most every ``progress_interval`` seconds; it may be a coroutine
+    function. ``refresh_url`` is an optional coroutine function returning a
+    fresh URL when the current one has expired.
+    """
+
+    def __init__(self, url, path, connections=DOWNLOAD_CONNECTIONS, segment_size=DOWNLOAD_SEGMENT_SIZE,
+                 progress=None, progress_interval=1.0, refresh_url=None):
+        self.url = url
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.state_path = f"{path}.state"
+        self.connections = connections
+        self.segment_size = segment_size
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.refresh_url = refresh_url
+        self.size = None
+        self.etag = None
+        self.done = None  # bitmap of finished segments
+        self.done_bytes = 0
+        self.fetched_bytes = 0  # this run only, for throughput
+        self.started_at = None
+        self._last_progress = 0.0
+        self._url_lock = asyncio.Lock()
+        self._state_lock = asyncio.Lock()
+
+    @property
+    def segment_count(self):
+        return (self.size + self.segment_size - 1) // self.segment_size
+
+    def _segment_bounds(self, index):
+        """Inclusive byte range of a segment"""
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, self.size) - 1
+
+    def _is_done(self, index):
+        return bool(self.done[index // 8] & (1 << (index % 8)))
+
+    def _mark_done(self, index):
+        self.done[index // 8] |= 1 << (index % 8)
+
+    @property
+    def throughput(self):
+        """Bytes per second fetched in this run"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return self.fetched_bytes / elapsed if elapsed > 0 else 0.0
+
+    async def _probe(self, session, refreshed=False):
+        """Learn the file size and whether ranges are served"""
+        headers = {**DOWNLOAD_HEADERS, "Range": "bytes=0-0"}
+        async with session.get(self.url, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status in EXPIRED_STATUSES and not refreshed and await self._refresh(self.url):
+                return await self._probe(session, refreshed=True)
+            if response.status == 206:
+                match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+                if match:
+                    self.etag = response.headers.get("ETag")
+                    return int(match.group(1)), True
+            if response.status == 200 and response.content_length:
+                return response.content_length, False
+            raise DownloadError(f"Cannot size download: upstream returned {response.status}")
+
+    async def _refresh(self, failed_url):
+        """Swap in a fresh URL once per expiry, shared by all workers"""
+        if self.refresh_url is None:
+            return False
+
+        async with self._url_lock:
+            if self.url != failed_url:
+                return True  # another worker already refreshed it
+            url = await self.refresh_url()
+            if not url or url == failed_url:
+                return False
+            logger.info(f"Refreshed expired download URL for {self.path}")
+            self.url = url
+            return True
+
+    def _load_state(self):
+        """Resume bitmap from a previous run, if it matches this file"""
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if state.get("size") != self.size or state.get("segment_size") != self.segment_size:
+            return None
+        if self.etag and state.get("etag") and state["etag"] != self.etag:
+            return None
+        if not os.path.exists(self.part_path):
+            return None
+        return bytearray.fromhex(state["done"])
+
+    def _save_state(self, fd, done_hex):
+        """Persist a bitmap snapshot once the data it covers is on disk"""
+        os.fsync(fd)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "size": self.size,
+                "segment_size": self.segment_size,
+                "etag": self.etag,
+                "done": done_hex
+            }, f)
+        os.replace(tmp_path, self.state_path)
+
+    async def _report(self, force=False):
+        """Call the progress callback, rate limited"""
+        if self.progress is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+
+        try:
+            result = self.progress(self.done_bytes, self.size, self.throughput)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logger.error(f"Download progress callback failed: {e}")
+
+    async def _fetch_segment(self, session, fd, index):
+        """Fetch one segment into its place in the file, retrying on errors"""
+        start, end = self._segment_bounds(index)
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            url = self.url
+            written = 0
+            try:
+                headers = {**DOWNLOAD_HEADERS, "Range": f"bytes={start}-{end}"}
+                async with session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                    if response.status in EXPIRED_STATUSES and await self._refresh(url):
+                        continue
+                    if response.status != 206:
+                        raise DownloadError(f"Segment {index}: upstream returned {response.status}")
+
+                    async for chunk in response.content.iter_chunked(MEDIA_CHUNK_SIZE):
+                        chunk = chunk[:end - start + 1 - written]
+                        # Positional write: segments land in place in any order
+                        os.pwrite(fd, chunk, start + written)
+                        written += len(chunk)
+                        self.fetched_bytes += len(chunk)
+                        await self._report()
+
+                if written != end - start + 1:
+                    raise DownloadError(f"Segment {index}: got {written} of {end - start + 1} bytes")
+
+                self.done_bytes += written
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                self.fetched_bytes -= written
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.warning(f"Retrying segment {index} of {self.path}: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+        raise DownloadError(f"Segment {index}: link expired and could not be refreshed")
+
+    async def _worker(self, session, fd, queue):
+        """Take segments off the queue until it is empty"""
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            await self._fetch_segment(session, fd, index)
+            self._mark_done(index)
+            # Snapshot before syncing, so no segment is recorded ahead of its data
+            async with self._state_lock:
+                await asyncio.to_thread(self._save_state, fd, self.done.hex())
+
+    async def _single_stream(self, session, fd):
+        """Fallback when the upstream ignores ranges"""
+        async with session.get(self.url, headers=DOWNLOAD_HEADERS, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status != 200:
+                raise DownloadError(f"Upstream returned {response.status}")
+            async for chunk in response.content.iter_chunked(MEDIA_CHUNK_SIZE):
+                os.pwrite(fd, chunk, self.done_bytes)
+                self.done_bytes += len(chunk)
+                self.fetched_bytes += len(chunk)
+                await self._report()
+
+    async def run(self):
+        """Download the file and return its path"""
+        session = await media_pool.get_session()
+        self.size, ranged = await self._probe(session)
+        self.started_at = time.monotonic()
+
+        fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not ranged:
+                os.ftruncate(fd, 0)
+                await self._single_stream(session, fd)
+            else:
+                self.done = self._load_state() or bytearray((self.segment_count + 7) // 8)
+                pending = [i for i in range(self.segment_count) if not self._is_done(i)]
+                self.done_bytes = self.size - sum(
+                    self._segment_bounds(i)[1] - self._segment_bounds(i)[0] + 1 for i in pending
+                )
+                if len(pending) < self.segment_count:
+                    logger.info(f"Resuming {self.path}: {self.segment_count - len(pending)}/{self.segment_count} segments done")
+
+                # Preallocate so positional writes never extend the file
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, self.size)
+                else:
+                    os.ftruncate(fd, self.size)
+
+                queue = asyncio.Queue()
+                for index in pending:
+                    queue.put_nowait(index)
+                workers = [
+                    asyncio.create_task(self._worker(session, fd, queue))
+                    for _ in range(min(self.connections, len(pending)))
+                ]
+                try:
+                    await asyncio.gather(*workers)
+                except BaseException:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    raise
+
+            if os.fstat(fd).st_size != self.size or self.done_bytes != self.size:
+                raise DownloadError(f"Size mismatch: expected {self.size}, got {self.done_bytes}")
+        finally:
+            os.close(fd)
+
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.unlink(self.state_path)
+        await self._report(force=True)
+        return self.path
+
+    def discard(self):
+        """Delete the partial file and its resume state"""
+        for path in (self.part_path, self.state_path, f"{self.state_path}.tmp"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Get download progress"""
+        return {
+            "path": self.path,
+            "size": self.size,
+            "done_bytes": self.done_bytes,
+            "throughput": round(self.throughput, 1),
+            "connections": self.connections
+        }
+
+# Files a download leaves behind until it finishes
+PARTIAL_SUFFIXES = (".part", ".state", ".state.tmp")
+
+def remove_stale_parts(directory, max_age):
+    """Delete resume files not written to for max_age seconds; returns the count"""
+    if not os.path.isdir(directory):
+        return 0
+
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(PARTIAL_SUFFIXES):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+async def download_file(url, path, **options):
+    """Download a URL to path with SegmentedDownload and return the path"""
+    return await SegmentedDownload(url, path, **options).run()
@@ -0,0 +1,82 @@
+"""
+Extraction strategy registry for TeraBox Bot
+
+A strategy is a coroutine ``handler(scraper, url, session, deadline)`` that
+returns a dict of video fields or None. Strategies are tried per domain in
+order of expected time to a successful resolution, learned from rolling
+success and latency statistics. Strategies registered with ``metadata=True``
+supply the title, thumbnail and size, so they still run after a cheaper
+strategy has found the links. ``quality`` ranks where links come from: links
+from a higher-quality strategy replace those of a lower one, such as URLs
+that were only guessed.
+"""
+import logging
+from urllib.parse import urlparse
+from metrics import RollingStats
+
+logger = logging.getLogger(__name__)
+
+class Strategy:
+    """One registered extraction strategy"""
+
+    def __init__(self, name, handler, domains=None, metadata=False, quality=1):
+        self.name = name
+        self.handler = handler
+        self.metadata = metadata
+        self.quality = quality
+        self.domains = set(domains) if domains else None  # None means every domain
+
+    def applies_to(self, domain):
+        """Check if the strategy is registered for a domain"""
+        return self.domains is None or domain in self.domains
+
+class StrategyRegistry:
+    """Strategies with per-domain statistics"""
+
+    def __init__(self):
+        self._strategies = []
+        self._stats = {}  # (domain, name) -> RollingStats
+
+    def register(self, name, handler, domains=None, metadata=False, quality=1):
+        """Register or replace a strategy"""
+        self._strategies = [s for s in self._strategies if s.name != name]
+        self._strategies.append(Strategy(name, handler, domains, metadata, quality))
+
+    def _get_stats(self, domain, name):
+        """Get or create the statistics for a strategy on a domain"""
+        key = (domain, name)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RollingStats()
+        return stats
+
+    def ordered(self, domain):
+        """Strategies for a domain, cheapest expected success first
+
+        Ties keep registration order, so untried strategies run in the
+        order they were registered.
+        """
+        strategies = [s for s in self._strategies if s.applies_to(domain)]
+        return sorted(strategies, key=lambda s: self._get_stats(domain, s.name).expected_cost())
+
+    def record(self, domain, name, success, latency):
+        """Fold one attempt into a strategy's statistics"""
+        self._get_stats(domain, name).record(success, latency)
+
+    def stats(self):
+        """Get statistics grouped by domain"""
+        result = {}
+        for (domain, name), stats in self._stats.items():
+            result.setdefault(domain, {})[name] = {
+                **stats.snapshot(),
+                "expected_cost": round(stats.expected_cost(), 4)
+            }
+        return result
+
+def strategy_domain(url):
+    """Domain key used for strategy statistics"""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+# Process-wide registry; the scraper registers its built-in strategies
+strategy_registry = StrategyRegistry()
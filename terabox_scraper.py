@@ -1,360 +1,521 @@
 import re
-import aiohttp
 import asyncio
 import json
+import os
+import uuid
+import socket
 import logging
-from urllib.parse import urlparse, parse_qs, unquote
-from bs4 import BeautifulSoup
+import time
+from datetime import datetime, timedelta
 import trafilatura
+from cache import TTLCache, NegativeCache
+from http_client import http_pool, DEFAULT_HEADERS
+from host_control import host_slot, CircuitOpenError
+from metrics import RollingStats
+from page_parser import parse_html, title_from_url, EarlyFieldScanner
+from deadline import Deadline
+from strategies import strategy_registry, strategy_domain
+from utils import extract_terabox_id, link_expiry
+from mongodb_config import MongoResolution
+from config_vars import (
+    RESOLUTION_CACHE_TTL, RESOLUTION_CACHE_SIZE,
+    PROBE_MODE, PROBE_TIMEOUT, PROBE_DEADLINE,
+    HEDGE_DELAY, HEDGE_DELAY_MAX, HEDGE_ADAPTIVE,
+    STREAM_FETCH_ENABLED, STREAM_FETCH_CHUNK_SIZE, STREAM_FETCH_MAX_BYTES,
+    RESOLVE_BUDGET, RESOLVE_GRACE,
+    NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_MAX_TTL, NEGATIVE_CACHE_SIZE,
+    SHARED_CACHE_ENABLED, SHARED_CACHE_TTL, SHARED_CACHE_POLL_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
+# Process-wide cache of resolved shares, keyed by share ID
+resolution_cache = TTLCache(
+    maxsize=RESOLUTION_CACHE_SIZE,
+    ttl=RESOLUTION_CACHE_TTL,
+    name="resolution"
+)
+
+# Identifies this process when leasing shares in the shared cache tier
+NODE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# Times a waiting node may take over a lease released without a result
+SHARED_WAIT_ROUNDS = 3
+
+# Shared (Mongo) cache tier counters
+shared_stats = {'hits': 0, 'waits': 0, 'wait_timeouts': 0, 'holder_failures': 0, 'scrapes': 0}
+
+def cache_ttl(video_info):
+    """In-process cache lifetime: the configured TTL, cut short by link expiry"""
+    expires_at = link_expiry(video_info)
+    if expires_at is None:
+        return RESOLUTION_CACHE_TTL
+    return min(RESOLUTION_CACHE_TTL, (expires_at - datetime.utcnow()).total_seconds())
+
+# Shares that failed to resolve, with exponentially growing suppression
+failure_cache = NegativeCache(
+    base_ttl=NEGATIVE_CACHE_TTL,
+    max_ttl=NEGATIVE_CACHE_MAX_TTL,
+    maxsize=NEGATIVE_CACHE_SIZE,
+    name="unresolvable"
+)
+
+# Share page fetch counters
+fetch_stats = {'early_exits': 0, 'full_fetches': 0, 'fallbacks': 0, 'bytes_read': 0}
+
+# API endpoints tried by _extract_from_api
+API_ENDPOINTS = [
+    ('terabox', "https://www.terabox.com/api/file/download?fid={file_id}"),
+    ('teraboxlink', "https://teraboxlink.com/api/file/info?id={file_id}"),
+]
+
+# Per-endpoint latency/success and the number of hedge races each one won
+api_stats = {name: RollingStats() for name, _ in API_ENDPOINTS}
+api_wins = {name: 0 for name, _ in API_ENDPOINTS}
+
+def hedge_delay(primary):
+    """Seconds to wait on the primary endpoint before hedging"""
+    if not HEDGE_ADAPTIVE or api_stats[primary].attempts == 0:
+        return HEDGE_DELAY
+    
+    # Hedge only the slow tail: about one healthy request in twenty
+    return min(api_stats[primary].latency_percentile(95), HEDGE_DELAY_MAX)
+
+# Fields holding links, taken as a set from the best source that has them
+LINK_FIELDS = ('download_urls', 'video_url')
+
+# Candidate download URL patterns tried by _generate_download_urls
+PROBE_PATTERNS = [
+    ('dl_path', lambda url: url.replace('/s/', '/dl/')),
+    ('download_param', lambda url: url + '&download=1'),
+    ('download_suffix', lambda url: url + '/download'),
+    ('dl_subdomain', lambda url: url.replace('terabox.com', 'dl.terabox.com')),
+]
+
+# Per-pattern probe outcomes, used to rank the patterns
+probe_stats = {name: RollingStats() for name, _ in PROBE_PATTERNS}
+
 class TeraBoxScraper:
     def __init__(self):
-        self.session = None
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        self.headers = DEFAULT_HEADERS
     
     async def get_session(self):
-        """Get or create aiohttp session"""
-        if not self.session:
-            connector = aiohttp.TCPConnector(ssl=False)
-            self.session = aiohttp.ClientSession(
-                headers=self.headers,
-                connector=connector,
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-        return self.session
+        """Get the shared aiohttp session"""
+        return await http_pool.get_session()
     
-    async def extract_video_info(self, url):
-        """Extract video information from TeraBox URL"""
+    async def extract_video_info(self, url, force_refresh=False):
+        """Extract video information from TeraBox URL, using the resolution cache"""
+        share_id = extract_terabox_id(url) or url
+        if force_refresh:
+            resolution_cache.invalidate(share_id)
+            failure_cache.clear(share_id)
+        elif failure_cache.is_suppressed(share_id):
+            # Failed recently; answer instantly instead of scraping again
+            return None
+        
+        video_info = await resolution_cache.get_or_load(
+            share_id,
+            lambda: self._load_video_info(share_id, url, force_refresh),
+            ttl=cache_ttl,
+            cacheable=lambda info: not info.get('partial')
+        )
+        return dict(video_info) if video_info else None
+    
+    async def _load_video_info(self, share_id, url, force_refresh=False):
+        """Resolve a share once and update the failure cache"""
+        video_info = await self._load_shared(share_id, url, force_refresh)
+        if video_info:
+            failure_cache.clear(share_id)
+        else:
+            ttl = failure_cache.record_failure(share_id, url)
+            logger.info(f"Share {share_id} unresolvable, suppressing retries for {ttl:.0f}s")
+        return video_info
+    
+    async def _load_shared(self, share_id, url, force_refresh=False):
+        """Resolve through the Mongo cache tier so only one node scrapes a share"""
+        if not SHARED_CACHE_ENABLED:
+            return await self._resolve_video_info(url)
+        
+        claimed = True
         try:
-            session = await self.get_session()
+            video_info = None if force_refresh else await MongoResolution.find_resolved(share_id)
+            if video_info:
+                shared_stats['hits'] += 1
+                return video_info
             
-            # First, try to get the page content
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.error(f"Failed to fetch URL: {response.status}")
+            claimed = await MongoResolution.claim(share_id, NODE_ID, RESOLVE_BUDGET + RESOLVE_GRACE)
+            for _ in range(SHARED_WAIT_ROUNDS):
+                if claimed:
+                    break
+                # Another node is scraping this share; wait for its result
+                shared_stats['waits'] += 1
+                video_info, retry = await self._wait_for_shared(share_id)
+                if video_info:
+                    return video_info
+                if not retry:
+                    # The holder found the share unresolvable; that stands for us too
+                    shared_stats['holder_failures'] += 1
                     return None
-                
-                html_content = await response.text()
-            
-            # Parse HTML content
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Extract video information using multiple methods
-            video_info = await self._extract_from_page(soup, url, session)
-            
-            if not video_info:
-                # Try alternative extraction methods
-                video_info = await self._extract_from_api(url, session)
+                # Lease free again without a result: one waiter takes it over
+                claimed = await MongoResolution.claim(share_id, NODE_ID, RESOLVE_BUDGET + RESOLVE_GRACE)
+            if not claimed:
+                shared_stats['wait_timeouts'] += 1
+        except Exception as e:
+            logger.error(f"Shared resolution cache error for {share_id}: {e}")
+        
+        shared_stats['scrapes'] += 1
+        video_info = await self._resolve_video_info(url)
+        
+        try:
+            if video_info and not video_info.get('partial'):
+                expires_at = link_expiry(video_info) or datetime.utcnow() + timedelta(seconds=SHARED_CACHE_TTL)
+                await MongoResolution.store(share_id, NODE_ID, video_info, expires_at)
+            elif claimed and video_info:
+                # Partial: another node may do better with a fresh budget
+                await MongoResolution.release(share_id, NODE_ID)
+            elif claimed:
+                await MongoResolution.mark_failed(share_id, NODE_ID, NEGATIVE_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"Shared resolution cache error for {share_id}: {e}")
+        
+        return video_info
+    
+    async def _wait_for_shared(self, share_id):
+        """Poll the shared tier while another node holds the lease
+
+        Returns (video_info, retry). retry is True when the lease is free
+        again without a result (released after a partial result, expired, or
+        the wait ran out), so the caller should try to claim it; it is False
+        when the holder marked the share failed.
+        """
+        deadline = Deadline(RESOLVE_BUDGET + RESOLVE_GRACE)
+        while not deadline.expired:
+            await asyncio.sleep(deadline.cap(SHARED_CACHE_POLL_INTERVAL))
+            doc = await MongoResolution.find_state(share_id)
+            now = datetime.utcnow()
+            if doc is None:
+                return None, True
+            if doc.get('status') == 'failed':
+                return None, False
+            if doc.get('status') == 'resolved':
+                fresh = doc.get('expires_at') and doc['expires_at'] > now
+                return (doc['data'], False) if fresh else (None, True)
+            if doc.get('lease_until') and doc['lease_until'] < now:
+                return None, True
+        return None, True
+    
+    async def _resolve_video_info(self, url):
+        """Scrape video information from TeraBox URL within the resolution budget"""
+        deadline = Deadline(RESOLVE_BUDGET)
+        partial = {}
+        try:
+            session = await self.get_session()
             
-            return video_info
+            # Stages bound their own requests by the deadline; this is a backstop
+            return await asyncio.wait_for(
+                self._run_pipeline(url, session, deadline, partial),
+                timeout=deadline.remaining() + RESOLVE_GRACE
+            )
             
+        except asyncio.TimeoutError:
+            logger.warning(f"Resolution budget exhausted for {url}")
+            return self._partial_result(url, partial)
         except Exception as e:
             logger.error(f"Error extracting video info: {e}")
+            return self._partial_result(url, partial)
+    
+    async def _run_pipeline(self, url, session, deadline, partial):
+        """Try the domain's strategies, cheapest expected success first
+
+        Once a link is found only metadata strategies still run, so a cheap
+        link-only strategy never replaces the page's title and thumbnail.
+        Links from a higher-quality strategy replace lower-quality ones, and
+        a strategy whose links were replaced is recorded as a failure so it
+        stops ranking ahead of the better source.
+        """
+        domain = strategy_domain(url)
+        strategies = strategy_registry.ordered(domain)
+        metadata_left = sum(1 for strategy in strategies if strategy.metadata)
+        found_link = False
+        link_quality = None  # quality of the strategy whose links are kept
+        outcomes = []
+        try:
+            for strategy in strategies:
+                if deadline.expired:
+                    break
+                if found_link and not strategy.metadata:
+                    continue
+                
+                started = time.monotonic()
+                try:
+                    result = await strategy.handler(self, url, session, deadline)
+                except Exception as e:
+                    logger.error(f"Strategy {strategy.name} failed for {url}: {e}")
+                    result = None
+                
+                success = bool(result and (result.get('download_urls') or result.get('video_url')))
+                outcomes.append((strategy, success, time.monotonic() - started))
+                
+                replace_links = success and (link_quality is None or strategy.quality > link_quality)
+                if replace_links:
+                    link_quality = strategy.quality
+                    for key in LINK_FIELDS:
+                        partial.pop(key, None)
+                
+                # Links follow source quality; other fields keep the first value found
+                for key, value in (result or {}).items():
+                    if not value:
+                        continue
+                    if key in LINK_FIELDS:
+                        if replace_links:
+                            partial[key] = value
+                    elif not partial.get(key):
+                        partial[key] = value
+                
+                found_link = found_link or success
+                if strategy.metadata:
+                    metadata_left -= 1
+                if found_link and not metadata_left:
+                    break
+        finally:
+            for strategy, success, latency in outcomes:
+                superseded = success and strategy.quality < link_quality
+                strategy_registry.record(domain, strategy.name, success and not superseded, latency)
+        
+        # Partial only if the budget ran out before a link and the metadata arrived
+        complete = found_link and not metadata_left
+        return self._partial_result(url, partial, is_partial=not complete)
+    
+    def _partial_result(self, url, partial, is_partial=True):
+        """Best result gathered so far, or None if it has no usable link"""
+        if not (partial.get('download_urls') or partial.get('video_url')):
             return None
+        
+        video_info = {
+            'title': title_from_url(url),
+            'download_urls': [],
+            'video_url': None,
+            'thumbnail_url': None
+        }
+        video_info.update(partial)
+        if is_partial:
+            video_info['partial'] = True
+        return video_info
     
-    async def _extract_from_page(self, soup, url, session):
-        """Extract video info from HTML page"""
+    async def _extract_via_page(self, url, session, deadline):
+        """Fetch and parse the share page"""
         try:
-            video_info = {}
-            
-            # Try to find video title
-            title_selectors = [
-                'title',
-                '.file-name',
-                '.filename',
-                'h1',
-                '.video-title',
-                '[data-title]'
-            ]
-            
-            title = None
-            for selector in title_selectors:
-                element = soup.select_one(selector)
-                if element:
-                    title = element.get_text(strip=True) or element.get('data-title')
-                    if title and len(title) > 5:  # Basic validation
-                        break
-            
-            if not title:
-                # Try to extract from URL or meta tags
-                title = self._extract_title_from_meta(soup) or self._extract_title_from_url(url)
+            # First, try to get the page content, stopping early when possible
+            page = await self._fetch_page(url, session, deadline, early_exit=STREAM_FETCH_ENABLED)
+            if not page:
+                return None
             
-            video_info['title'] = title or 'Unknown Video'
+            # Parse HTML content off the event loop
+            html_content, encoding, complete = page
+            page_data = await parse_html(html_content, url, encoding)
             
-            # Try to find download links
-            download_urls = await self._find_download_urls(soup, url, session)
-            video_info['download_urls'] = download_urls
+            if not complete and not (page_data['download_urls'] or page_data['video_url']):
+                # The early cut missed something; fall back to the full document
+                fetch_stats['fallbacks'] += 1
+                page = await self._fetch_page(url, session, deadline, early_exit=False)
+                if not page:
+                    return None
+                html_content, encoding, complete = page
+                page_data = await parse_html(html_content, url, encoding)
             
-            # Try to find video URL for streaming
-            video_url = await self._find_video_url(soup, url, session)
-            video_info['video_url'] = video_url
+            return self._extract_from_page(page_data)
             
-            # Try to extract file size and other metadata
-            file_info = self._extract_file_info(soup)
-            video_info.update(file_info)
+        except CircuitOpenError as e:
+            # Skip straight to the next strategy while the host is failing
+            logger.warning(f"Skipping share page: {e}")
+            return None
+        except asyncio.TimeoutError:
+            logger.warning(f"Share page timed out: {url}")
+            return None
+    
+    async def _fetch_page(self, url, session, deadline, early_exit=True):
+        """Fetch a share page as (bytes, charset, complete) or None
+
+        With early_exit the body is read in chunks and the download stops once
+        the title and a link field have arrived, unless STREAM_FETCH_MAX_BYTES
+        is passed first, in which case the rest of the page is read.
+        """
+        timeout = deadline.timeout()
+        async with host_slot(url) as slot, session.get(url, timeout=timeout) as response:
+            slot.record_status(response.status)
+            if response.status != 200:
+                logger.error(f"Failed to fetch URL: {response.status}")
+                return None
             
-            # Try to find thumbnail
-            thumbnail = self._find_thumbnail(soup)
-            video_info['thumbnail_url'] = thumbnail
+            if not early_exit:
+                html_content = await response.read()
+                fetch_stats['full_fetches'] += 1
+                fetch_stats['bytes_read'] += len(html_content)
+                return html_content, response.charset, True
             
-            return video_info if download_urls or video_url else None
+            scanner = EarlyFieldScanner()
+            buffer = bytearray()
+            async for chunk in response.content.iter_chunked(STREAM_FETCH_CHUNK_SIZE):
+                buffer.extend(chunk)
+                if len(buffer) <= STREAM_FETCH_MAX_BYTES and scanner.feed(buffer):
+                    fetch_stats['early_exits'] += 1
+                    fetch_stats['bytes_read'] += len(buffer)
+                    return bytes(buffer), response.charset, False
             
-        except Exception as e:
-            logger.error(f"Error extracting from page: {e}")
-            return None
+            fetch_stats['full_fetches'] += 1
+            fetch_stats['bytes_read'] += len(buffer)
+            return bytes(buffer), response.charset, True
+    
+    def _extract_from_page(self, page_data):
+        """Build video info from parsed page fields"""
+        video_info = {
+            'title': page_data['title'],
+            'video_url': page_data['video_url'],
+            'thumbnail_url': page_data['thumbnail_url'],
+            'download_urls': page_data['download_urls']
+        }
+        
+        # File size and other metadata
+        for key in ('file_size', 'duration'):
+            if key in page_data:
+                video_info[key] = page_data[key]
+        
+        return video_info if video_info['download_urls'] or video_info['video_url'] else None
     
-    async def _extract_from_api(self, url, session):
-        """Try to extract using API endpoints"""
+    async def _extract_via_probes(self, url, session, deadline):
+        """Find download URLs by probing common URL patterns"""
+        download_urls = await self._generate_download_urls(url, session, deadline)
+        return {'download_urls': download_urls} if download_urls else None
+    
+    async def _extract_from_api(self, url, session, deadline):
+        """Try API endpoints with hedged requests, taking the first usable answer"""
         try:
             # Extract file ID from URL
             file_id = self._extract_file_id(url)
             if not file_id:
                 return None
             
-            # Try different API endpoints
-            api_endpoints = [
-                f"https://www.terabox.com/api/file/download?fid={file_id}",
-                f"https://teraboxlink.com/api/file/info?id={file_id}",
-            ]
-            
-            for endpoint in api_endpoints:
-                try:
-                    async with session.get(endpoint) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            video_info = self._parse_api_response(data)
-                            if video_info:
-                                return video_info
-                except:
-                    continue
+            # Cheapest endpoint goes first; the others are hedges
+            ranked = sorted(API_ENDPOINTS, key=lambda item: api_stats[item[0]].expected_cost())
+            delay = hedge_delay(ranked[0][0])
+            if deadline.expired:
+                return None
             
-            return None
+            pending = set()
+            try:
+                for i, (name, template) in enumerate(ranked):
+                    endpoint = template.format(file_id=file_id)
+                    pending.add(asyncio.ensure_future(self._query_api(name, endpoint, session, deadline)))
+                    
+                    # Give the running requests until the hedge delay before adding another
+                    is_last = i == len(ranked) - 1
+                    video_info = await self._first_api_result(pending, deadline.cap(None if is_last else delay))
+                    if video_info:
+                        return video_info
+                
+                return None
+            finally:
+                for task in pending:
+                    task.cancel()
             
         except Exception as e:
             logger.error(f"Error extracting from API: {e}")
             return None
     
-    async def _find_download_urls(self, soup, original_url, session):
-        """Find download URLs from the page"""
-        download_urls = []
-        
-        # Look for direct download links
-        download_selectors = [
-            'a[href*="download"]',
-            'a[href*="dl."]',
-            'a[data-url]',
-            '.download-btn',
-            '.btn-download',
-            'a[href*=".mp4"]',
-            'a[href*=".mkv"]',
-            'a[href*=".avi"]'
-        ]
-        
-        for selector in download_selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                href = element.get('href') or element.get('data-url')
-                if href:
-                    if href.startswith('/'):
-                        href = f"https://www.terabox.com{href}"
-                    elif not href.startswith('http'):
-                        continue
-                    download_urls.append(href)
-        
-        # Look for JavaScript variables containing download URLs
-        scripts = soup.find_all('script')
-        for script in scripts:
-            if script.string:
-                # Look for download URLs in JavaScript
-                url_patterns = [
-                    r'"(https?://[^"]*\.mp4[^"]*)"',
-                    r'"(https?://[^"]*download[^"]*)"',
-                    r'"download_url":\s*"([^"]+)"',
-                    r'"dlink":\s*"([^"]+)"'
-                ]
-                
-                for pattern in url_patterns:
-                    matches = re.findall(pattern, script.string)
-                    for match in matches:
-                        if match not in download_urls:
-                            download_urls.append(match)
-        
-        # If no direct download URLs found, try to generate them
-        if not download_urls:
-            download_urls = await self._generate_download_urls(original_url, session)
-        
-        return list(set(download_urls))  # Remove duplicates
-    
-    async def _find_video_url(self, soup, original_url, session):
-        """Find streaming video URL"""
-        # Look for video tags
-        video_element = soup.find('video')
-        if video_element:
-            src = video_element.get('src')
-            if src:
-                return src if src.startswith('http') else f"https://www.terabox.com{src}"
-        
-        # Look for source tags
-        source_elements = soup.find_all('source')
-        for source in source_elements:
-            src = source.get('src')
-            if src and any(ext in src for ext in ['.mp4', '.webm', '.ogg']):
-                return src if src.startswith('http') else f"https://www.terabox.com{src}"
-        
-        # Look in JavaScript for video URLs
-        scripts = soup.find_all('script')
-        for script in scripts:
-            if script.string:
-                patterns = [
-                    r'"video_url":\s*"([^"]+)"',
-                    r'"stream_url":\s*"([^"]+)"',
-                    r'"playUrl":\s*"([^"]+)"'
-                ]
-                
-                for pattern in patterns:
-                    match = re.search(pattern, script.string)
-                    if match:
-                        return match.group(1)
+    async def _first_api_result(self, pending, timeout):
+        """Wait for the first parsed API response among pending requests"""
+        until = time.monotonic() + timeout
+        while pending:
+            remaining = max(until - time.monotonic(), 0)
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                return None
+            
+            for task in done:
+                pending.discard(task)
+                name, video_info = task.result()
+                if video_info:
+                    api_wins[name] += 1
+                    return video_info
         
         return None
     
-    async def _generate_download_urls(self, original_url, session):
-        """Generate potential download URLs"""
-        download_urls = []
-        
-        # Try common download URL patterns
-        base_patterns = [
-            original_url.replace('/s/', '/dl/'),
-            original_url + '&download=1',
-            original_url + '/download',
-            original_url.replace('terabox.com', 'dl.terabox.com'),
-        ]
-        
-        for pattern in base_patterns:
-            # Validate URL before adding
-            try:
-                async with session.head(pattern, allow_redirects=True) as response:
-                    if response.status in [200, 302]:
-                        download_urls.append(str(response.url))
-            except:
-                continue
+    async def _query_api(self, name, endpoint, session, deadline):
+        """Query one API endpoint and parse its response"""
+        started = time.monotonic()
+        video_info = None
+        try:
+            timeout = deadline.timeout()
+            async with host_slot(endpoint) as slot, session.get(endpoint, timeout=timeout) as response:
+                slot.record_status(response.status)
+                if response.status == 200:
+                    data = await response.json(content_type=None)
+                    video_info = self._parse_api_response(data)
+        except asyncio.CancelledError:
+            # Lost the hedge race
+            raise
+        except Exception as e:
+            logger.warning(f"API endpoint {name} failed: {e}")
         
-        return download_urls
+        api_stats[name].record(video_info is not None, time.monotonic() - started)
+        return name, video_info
     
-    def _extract_file_info(self, soup):
-        """Extract file information like size, duration"""
-        info = {}
-        
-        # Look for file size
-        size_patterns = [
-            r'(\d+(?:\.\d+)?)\s*(MB|GB|KB)',
-            r'Size:\s*(\d+(?:\.\d+)?)\s*(MB|GB|KB)',
-            r'(\d+(?:\.\d+)?)\s*(mb|gb|kb)'
-        ]
-        
-        text_content = soup.get_text()
-        for pattern in size_patterns:
-            match = re.search(pattern, text_content, re.IGNORECASE)
-            if match:
-                size_value = float(match.group(1))
-                size_unit = match.group(2).upper()
-                
-                # Convert to bytes
-                multipliers = {'KB': 1024, 'MB': 1024**2, 'GB': 1024**3}
-                info['file_size'] = int(size_value * multipliers.get(size_unit, 1))
-                break
-        
-        # Look for duration
-        duration_patterns = [
-            r'(\d+):(\d+):(\d+)',  # HH:MM:SS
-            r'(\d+):(\d+)',        # MM:SS
-            r'Duration:\s*(\d+):(\d+):(\d+)',
-            r'Length:\s*(\d+):(\d+)'
-        ]
+    async def _generate_download_urls(self, original_url, session, deadline):
+        """Generate potential download URLs by probing candidate patterns concurrently"""
+        # Best-performing patterns first; this also orders results in "all" mode
+        ranked = sorted(PROBE_PATTERNS, key=lambda item: probe_stats[item[0]].success_rate, reverse=True)
         
-        for pattern in duration_patterns:
-            match = re.search(pattern, text_content)
-            if match:
-                groups = match.groups()
-                if len(groups) == 3:
-                    hours, minutes, seconds = map(int, groups)
-                    info['duration'] = hours * 3600 + minutes * 60 + seconds
-                elif len(groups) == 2:
-                    minutes, seconds = map(int, groups)
-                    info['duration'] = minutes * 60 + seconds
-                break
-        
-        return info
-    
-    def _find_thumbnail(self, soup):
-        """Find video thumbnail"""
-        # Look for image tags
-        img_selectors = [
-            'img[src*="thumb"]',
-            'img[src*="preview"]',
-            'img[data-src*="thumb"]',
-            '.thumbnail img',
-            '.preview img'
-        ]
+        candidates = {}
+        for name, build in ranked:
+            candidates.setdefault(build(original_url), name)
         
-        for selector in img_selectors:
-            img = soup.select_one(selector)
-            if img:
-                src = img.get('src') or img.get('data-src')
-                if src:
-                    return src if src.startswith('http') else f"https://www.terabox.com{src}"
-        
-        # Look for meta tags
-        meta_image = soup.find('meta', property='og:image')
-        if meta_image:
-            return meta_image.get('content')
-        
-        return None
-    
-    def _extract_title_from_meta(self, soup):
-        """Extract title from meta tags"""
-        meta_title = soup.find('meta', property='og:title')
-        if meta_title:
-            return meta_title.get('content')
+        tasks = {
+            asyncio.ensure_future(self._probe_download_url(name, candidate, session, deadline)): name
+            for candidate, name in candidates.items()
+        }
+        rank = {name: i for i, (name, _) in enumerate(ranked)}
+        found = {}
         
-        meta_title = soup.find('meta', attrs={'name': 'title'})
-        if meta_title:
-            return meta_title.get('content')
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=deadline.cap(PROBE_DEADLINE)):
+                try:
+                    name, download_url = await next_done
+                except asyncio.TimeoutError:
+                    break
+                
+                if download_url and download_url not in found:
+                    found[download_url] = rank[name]
+                    if PROBE_MODE == 'first':
+                        break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
         
-        return None
+        return sorted(found, key=found.get)
     
-    def _extract_title_from_url(self, url):
-        """Extract title from URL"""
+    async def _probe_download_url(self, name, candidate, session, deadline):
+        """Validate one candidate URL with a short HEAD request"""
+        started = time.monotonic()
+        download_url = None
         try:
-            # Parse URL to get filename
-            parsed = urlparse(url)
-            path_parts = parsed.path.split('/')
-            
-            # Look for filename in path
-            for part in reversed(path_parts):
-                if part and '.' in part:
-                    # Remove file extension
-                    return part.rsplit('.', 1)[0].replace('_', ' ').replace('-', ' ')
-            
-            # Look in query parameters
-            query_params = parse_qs(parsed.query)
-            for key in ['filename', 'title', 'name']:
-                if key in query_params:
-                    return unquote(query_params[key][0])
-            
-        except:
+            timeout = deadline.timeout(PROBE_TIMEOUT)
+            async with host_slot(candidate) as slot, session.head(
+                candidate,
+                allow_redirects=True,
+                timeout=timeout
+            ) as response:
+                slot.record_status(response.status)
+                if response.status in [200, 302]:
+                    download_url = str(response.url)
+        except asyncio.CancelledError:
+            # Lost the race to another pattern; says nothing about this one
+            raise
+        except Exception:
             pass
         
-        return "TeraBox Video"
+        probe_stats[name].record(download_url is not None, time.monotonic() - started)
+        return name, download_url
     
     def _extract_file_id(self, url):
         """Extract file ID from TeraBox URL"""
@@ -398,6 +559,11 @@ class TeraBoxScraper:
             return None
     
     async def close(self):
-        """Close the session"""
-        if self.session:
-            await self.session.close()
+        """Release the scraper; the shared HTTP pool is closed on shutdown"""
+        pass
+
+# Built-in strategies, in their default order for untried domains
+strategy_registry.register('page', TeraBoxScraper._extract_via_page, metadata=True)
+# Probed URLs are guesses that answered a HEAD; any real link beats them
+strategy_registry.register('probe', TeraBoxScraper._extract_via_probes, quality=0)
+strategy_registry.register('api', TeraBoxScraper._extract_from_api)
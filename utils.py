@@ -190,3 +190,58 @@ def is_mobile_user_agent(user_agent: str) -> bool:
     ]
     
     return any(re.search(pattern, user_agent, re.IGNORECASE) for pattern in mobile_patterns)
+
+def parse_link_expiry(url: str) -> Optional[datetime]:
+    """Parse the expiry time (UTC) from a signed download URL"""
+    if not url:
+        return None
+    
+    try:
+        from urllib.parse import urlparse, parse_qs
+        params = {key.lower(): values[0] for key, values in parse_qs(urlparse(url).query).items()}
+    except Exception:
+        return None
+    
+    for key in ('expires', 'expire', 'x-expires', 'exp', 'deadline'):
+        value = params.get(key)
+        if not value:
+            continue
+        
+        # Absolute epoch timestamp, in seconds or milliseconds
+        if value.isdigit() and int(value) > 10**9:
+            timestamp = int(value)
+            if timestamp > 10**12:
+                timestamp //= 1000
+            return datetime.utcfromtimestamp(timestamp)
+        
+        # Relative lifetime such as "8h", counted from the signing time if present
+        match = re.fullmatch(r'(\d+)([smhd]?)', value.lower())
+        if match:
+            units = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+            lifetime = timedelta(seconds=int(match.group(1)) * units[match.group(2)])
+            signed_at = params.get('time') or params.get('ts') or params.get('timestamp')
+            if signed_at and signed_at.isdigit() and int(signed_at) > 10**9:
+                return datetime.utcfromtimestamp(int(signed_at)) + lifetime
+            return datetime.utcnow() + lifetime
+    
+    return None
+
+def link_expiry(video_info: Dict[str, Any]) -> Optional[datetime]:
+    """Earliest expiry among a video's direct links"""
+    urls = list(video_info.get('download_urls') or [])
+    if video_info.get('video_url'):
+        urls.append(video_info['video_url'])
+    
+    expiries = [expiry for expiry in map(parse_link_expiry, urls) if expiry]
+    return min(expiries) if expiries else None
+
+async def run_periodically(func, interval: float, name: str = None):
+    """Run a coroutine function now and then forever, every interval seconds"""
+    import asyncio
+    name = name or getattr(func, '__qualname__', 'task')
+    while True:
+        try:
+            await func()
+        except Exception as e:
+            logger.error(f"Periodic task {name} failed: {e}")
+        await asyncio.sleep(interval)